@@ -0,0 +1,219 @@
+"""
+Load test for the API endpoints against a local database seeded with generated data.
+
+Starts the app on a local port, drives /signup, /login, /favorites, /character/<id>
+and /planet/<id> with a fixed number of client threads and prints (or saves) the
+latency percentiles, throughput and SQL statements per request as JSON, so two
+commits can be compared with a plain diff.
+
+$ pipenv run python benchmarks/bench_api.py --users 100000 --favorites 1000000 --output before.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+PASSWORD = 'Bench1234!'
+SEED_CHUNK = 10000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLAlchemy URL, a temporary SQLite file by default')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--favorites', type=int, default=10000, help='total favorites spread over the users')
+    parser.add_argument('--characters', type=int, default=100)
+    parser.add_argument('--planets', type=int, default=60)
+    parser.add_argument('--fixtures', help='load characters and planets with the importer from this folder instead of generating them')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000, help='requests per endpoint')
+    parser.add_argument('--hash-iterations', type=int, default=1000, help='password cost used by the server during the run')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    return parser.parse_args()
+
+
+def seed(args, db, models):
+    """Bulk inserts the generated rows, it takes seconds for 1M favorites on SQLite."""
+    from passwords import hash_password
+    rng = random.Random(args.seed)
+    db.drop_all()
+    db.create_all()
+
+    if args.fixtures:
+        from importer import import_resource
+        import_resource('people', fixtures=args.fixtures)
+        import_resource('planets', fixtures=args.fixtures)
+    else:
+        db.session.execute(models.Character.__table__.insert(), [{
+            "name": "Character %d" % i, "birth_day": "%dBBY" % i, "gender": rng.choice(["male", "female", "n/a"]),
+            "height": rng.randint(60, 250), "skin_color": "fair", "hair_color": "brown", "eye_color": "blue",
+        } for i in range(args.characters)])
+        db.session.execute(models.Planet.__table__.insert(), [{
+            "name": "Planet %d" % i, "climate": rng.choice(["arid", "temperate", "frozen"]), "population": str(i * 1000),
+            "terrain": rng.choice(["desert", "grasslands", "mountains"]), "rotation_period": 24, "orbital_period": 365,
+            "diameter": rng.randint(1000, 20000),
+        } for i in range(args.planets)])
+    character_ids = [id for (id,) in db.session.query(models.Character.id)]
+    planet_ids = [id for (id,) in db.session.query(models.Planet.id)]
+
+    # every seeded user shares one hash, hashing 100k passwords would take longer than the run
+    password = hash_password(PASSWORD, args.hash_iterations)
+    for start in range(0, args.users, SEED_CHUNK):
+        db.session.execute(models.User.__table__.insert(), [{
+            "id": i + 1, "username": "user%d" % i, "email": "user%d@bench.dev" % i, "password": password, "is_active": True,
+        } for i in range(start, min(start + SEED_CHUNK, args.users))])
+
+    per_user = min(args.favorites // max(args.users, 1), len(character_ids) + len(planet_ids))
+    rows = []
+    for user_id in range(1, args.users + 1):
+        for kind, id in rng.sample([("character_id", id) for id in character_ids] + [("planet_id", id) for id in planet_ids], per_user):
+            rows.append({"user_id": user_id, "character_id": id if kind == "character_id" else None,
+                         "planet_id": id if kind == "planet_id" else None})
+            if len(rows) == SEED_CHUNK:
+                db.session.execute(models.Favorite.__table__.insert(), rows)
+                rows = []
+    if rows:
+        db.session.execute(models.Favorite.__table__.insert(), rows)
+    db.session.commit()
+    return character_ids, planet_ids, per_user * args.users
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def sql_statements(response):
+    # the count comes from the Server-Timing header added by metrics.setup_metrics
+    for part in response.headers.get('Server-Timing', '').split(','):
+        if 'queries' in part:
+            return int(part.split('desc="')[1].split(' ')[0])
+    return None
+
+def drive(base_url, concurrency, total, make_request):
+    """Runs make_request(session, i) total times on concurrency threads."""
+    import requests
+    local = threading.local()
+    latencies = []
+    statements = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def one(i):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        response = make_request(local.session, base_url, i)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed * 1000)
+            count = sql_statements(response)
+            if count is not None:
+                statements.append(count)
+            if response.status_code >= 400:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors[0],
+        "req_per_sec": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "sql_per_request": round(sum(statements) / len(statements), 2) if statements else None,
+    }
+
+
+def main():
+    args = parse_args()
+    db_file = None
+    if not args.db:
+        db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        args.db = 'sqlite:///' + db_file
+    os.environ['DB_CONNECTION_STRING'] = args.db
+    os.environ['PASSWORD_HASH_ITERATIONS'] = str(args.hash_iterations)
+    os.environ['RATE_LIMIT_ENABLED'] = '0'
+    sys.path.insert(0, SRC)
+
+    from werkzeug.serving import make_server
+    from main import create_app
+    app = create_app()
+    import models
+
+    with app.app_context():
+        started = time.perf_counter()
+        character_ids, planet_ids, favorites = seed(args, models.db, models)
+        seed_seconds = time.perf_counter() - started
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:%d' % server.server_port
+    rng = random.Random(args.seed)
+
+    import requests
+    tokens = []
+    for i in rng.sample(range(args.users), min(args.users, 50)):
+        response = requests.post(base_url + '/login', json={"username": "user%d" % i, "password": PASSWORD})
+        tokens.append(response.json()[1]['token'])
+    run_id = int(time.time())
+
+    scenarios = {
+        "POST /signup": lambda session, url, i: session.post(url + '/signup', json={
+            "username": "new%d_%d" % (run_id, i), "email": "new%d_%d@bench.dev" % (run_id, i), "password": PASSWORD}),
+        "POST /login": lambda session, url, i: session.post(url + '/login', json={
+            "username": "user%d" % (i % args.users), "password": PASSWORD}),
+        "GET /favorites": lambda session, url, i: session.get(url + '/favorites', headers={
+            "Authorization": "Bearer " + tokens[i % len(tokens)]}),
+        "GET /character/<id>": lambda session, url, i: session.get(url + '/character/%d' % character_ids[i % len(character_ids)]),
+        "GET /planet/<id>": lambda session, url, i: session.get(url + '/planet/%d' % planet_ids[i % len(planet_ids)]),
+    }
+    results = {}
+    for name, make_request in scenarios.items():
+        results[name] = drive(base_url, args.concurrency, args.requests, make_request)
+        print('%-22s %s' % (name, results[name]), file=sys.stderr)
+    server.shutdown()
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    report = {
+        "commit": commit,
+        "config": {
+            "db": 'sqlite (temporary file)' if db_file else args.db.split('@')[-1],
+            "users": args.users,
+            "favorites": favorites,
+            "characters": len(character_ids),
+            "planets": len(planet_ids),
+            "concurrency": args.concurrency,
+            "requests_per_endpoint": args.requests,
+            "hash_iterations": args.hash_iterations,
+            "seed_seconds": round(seed_seconds, 2),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    if db_file:
+        os.remove(db_file)
+
+
+if __name__ == '__main__':
+    main()
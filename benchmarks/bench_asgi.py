@@ -0,0 +1,115 @@
+"""
+Compares the sync (gunicorn, wsgi.py) and async (uvicorn, asgi.py) servers on the
+read endpoints at a high number of concurrent clients.
+
+The difference shows when the database is a network hop away, point --db at a
+PostgreSQL or MySQL server for an I/O-bound run. The default temporary SQLite
+file mostly measures CPU.
+
+$ pipenv run python benchmarks/bench_asgi.py --db postgresql://localhost/bench --concurrency 200
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+from bench_api import SRC, PASSWORD, seed, drive
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLAlchemy URL, a temporary SQLite file by default')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--favorites', type=int, default=20000)
+    parser.add_argument('--characters', type=int, default=100)
+    parser.add_argument('--planets', type=int, default=60)
+    parser.add_argument('--fixtures')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per endpoint and server')
+    parser.add_argument('--sync-workers', type=int, default=4, help='gunicorn sync workers')
+    parser.add_argument('--hash-iterations', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output')
+    return parser.parse_args()
+
+
+def start_server(command, port, env):
+    process = subprocess.Popen(command, cwd=SRC, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    import requests
+    for _ in range(300):
+        try:
+            requests.get('http://127.0.0.1:%d/character/1' % port, timeout=5)
+            return process
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('%s did not start' % command[0])
+
+
+def main():
+    args = parse_args()
+    db_file = None
+    if not args.db:
+        db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        args.db = 'sqlite:///' + db_file
+    os.environ['DB_CONNECTION_STRING'] = args.db
+    os.environ['PASSWORD_HASH_ITERATIONS'] = str(args.hash_iterations)
+    os.environ['RATE_LIMIT_ENABLED'] = '0'
+    sys.path.insert(0, SRC)
+
+    from main import create_app
+    app = create_app()
+    import models
+    with app.app_context():
+        character_ids, planet_ids, favorites = seed(args, models.db, models)
+
+    import requests
+    servers = {
+        "sync": (8801, ['gunicorn', 'wsgi:application', '--workers', str(args.sync_workers), '--bind', '127.0.0.1:8801']),
+        "async": (8802, ['uvicorn', 'asgi:application', '--workers', '1', '--port', '8802', '--log-level', 'warning']),
+    }
+    rng = random.Random(args.seed)
+    results = {}
+    for name, (port, command) in servers.items():
+        process = start_server(command, port, dict(os.environ))
+        base_url = 'http://127.0.0.1:%d' % port
+        try:
+            tokens = [requests.post(base_url + '/login', json={"username": "user%d" % i, "password": PASSWORD}).json()[1]['token']
+                      for i in rng.sample(range(args.users), min(args.users, 50))]
+            results[name] = {
+                "GET /favorites": drive(base_url, args.concurrency, args.requests, lambda session, url, i: session.get(
+                    url + '/favorites', headers={"Authorization": "Bearer " + tokens[i % len(tokens)]})),
+                "GET /character/<id>": drive(base_url, args.concurrency, args.requests, lambda session, url, i: session.get(
+                    url + '/character/%d' % character_ids[i % len(character_ids)])),
+            }
+            print('%-6s %s' % (name, results[name]), file=sys.stderr)
+        finally:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "config": {
+            "db": 'sqlite (temporary file)' if db_file else args.db.split('@')[-1],
+            "users": args.users,
+            "favorites": favorites,
+            "concurrency": args.concurrency,
+            "requests_per_endpoint": args.requests,
+            "sync_workers": args.sync_workers,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    if db_file:
+        os.remove(db_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Measures how many password checks (one per login) a core can do at each PBKDF2 cost.
+
+$ pipenv run python benchmarks/bench_passwords.py --iterations 100000 260000 600000
+"""
+import os
+import sys
+import time
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import passwords  # noqa: E402
+
+
+def measure(iterations, workers, seconds):
+    passwords.configure(iterations=iterations, workers=workers)
+    stored = passwords.hash_password('Sup3r$ecret', iterations)
+    checks = 0
+    # one client thread per pool process keeps every process busy
+    threads = max(workers, 1)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as clients:
+        while time.perf_counter() - started < seconds:
+            checks += sum(clients.map(lambda _: passwords.verify_password('Sup3r$ecret', stored), range(threads)))
+    elapsed = time.perf_counter() - started
+    return {
+        "iterations": iterations,
+        "workers": workers,
+        "logins_per_sec": round(checks / elapsed, 1),
+        "logins_per_sec_per_core": round(checks / elapsed / threads, 1),
+        "ms_per_login": round(elapsed / checks * threads * 1000, 2),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, nargs='+', default=[100000, passwords.DEFAULT_ITERATIONS, 600000])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    results = []
+    for iterations in args.iterations:
+        results.append(measure(iterations, 0, args.seconds))
+        results.append(measure(iterations, args.workers, args.seconds))
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,109 @@
+"""
+Compares /search's in-memory index with the naive SQL approach (LIKE '%q%' on the
+searchable columns) on generated characters and planets.
+
+$ pipenv run python benchmarks/bench_search.py --characters 50000 --planets 20000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+from bench_api import SRC
+
+WORDS = ['sky', 'walker', 'dark', 'light', 'organa', 'solo', 'tatoo', 'ine', 'hoth', 'endor', 'naboo', 'kash', 'yyyk',
+         'bespin', 'dagobah', 'jakku', 'ren', 'kenobi', 'amidala', 'fett', 'windu', 'tano', 'andor', 'mon', 'calamari']
+TERRAINS = ['desert', 'grasslands', 'mountains', 'jungle', 'swamp', 'tundra', 'ocean', 'gas giant', 'forests']
+CLIMATES = ['arid', 'temperate', 'frozen', 'murky', 'tropical', 'windy']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLAlchemy URL, a temporary SQLite file by default')
+    parser.add_argument('--characters', type=int, default=20000)
+    parser.add_argument('--planets', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output')
+    return parser.parse_args()
+
+
+def timed(function, queries):
+    started = time.perf_counter()
+    for query in queries:
+        function(query)
+    return round((time.perf_counter() - started) / len(queries) * 1000, 4)
+
+
+def main():
+    args = parse_args()
+    db_file = None
+    if not args.db:
+        db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        args.db = 'sqlite:///' + db_file
+    os.environ['DB_CONNECTION_STRING'] = args.db
+    sys.path.insert(0, SRC)
+
+    from main import create_app
+    app = create_app()
+    from models import db, Character, Planet
+    from search import SearchIndex
+    rng = random.Random(args.seed)
+
+    def name():
+        return ' '.join(rng.choice(WORDS).capitalize() + rng.choice(WORDS) for _ in range(rng.randint(1, 2)))
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Character.__table__.insert(), [{
+            "name": name(), "birth_day": "x", "gender": "n/a", "height": 1, "skin_color": "x", "hair_color": "x", "eye_color": "x",
+        } for _ in range(args.characters)])
+        db.session.execute(Planet.__table__.insert(), [{
+            "name": name(), "climate": rng.choice(CLIMATES), "population": "0", "terrain": ', '.join(rng.sample(TERRAINS, 2)),
+            "rotation_period": 1, "orbital_period": 1, "diameter": 1,
+        } for _ in range(args.planets)])
+        db.session.commit()
+
+        queries = [rng.choice(WORDS + TERRAINS + CLIMATES)[:rng.randint(2, 5)] for _ in range(args.queries)]
+
+        def sql_like(query):
+            pattern = '%' + query + '%'
+            db.session.query(Character.id, Character.name).filter(Character.name.ilike(pattern)).limit(args.limit).all()
+            db.session.query(Planet.id, Planet.name).filter(db.or_(
+                Planet.name.ilike(pattern), Planet.terrain.ilike(pattern), Planet.climate.ilike(pattern)
+            )).limit(args.limit).all()
+
+        index = SearchIndex()
+        started = time.perf_counter()
+        # no background refresh, the benchmark only times the build
+        index.rebuild()
+        build_seconds = time.perf_counter() - started
+
+        def uncached(query):
+            index.results.clear()
+            index.search(query, args.limit)
+
+        report = {
+            "config": {"characters": args.characters, "planets": args.planets, "queries": args.queries, "limit": args.limit},
+            "index_build_seconds": round(build_seconds, 3),
+            "index_ms_per_query": timed(uncached, queries),
+            "index_memoized_ms_per_query": timed(lambda query: index.search(query, args.limit), queries),
+            "sql_like_ms_per_query": timed(sql_like, queries),
+        }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    if db_file:
+        os.remove(db_file)
+
+
+if __name__ == '__main__':
+    main()
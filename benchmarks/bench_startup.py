@@ -0,0 +1,77 @@
+"""
+Measures the cold start of a worker: importing main and calling create_app() in a
+fresh interpreter, with Flask-Admin and Flask-Migrate enabled ("full", the default)
+and without them ("api_only", ADMIN_ENABLED=0 MIGRATE_ENABLED=0).
+
+$ pipenv run python benchmarks/bench_startup.py --runs 20
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+from bench_api import SRC
+
+# printed by the child process: import time, create_app time (ms) and the heavy modules it loaded
+CHILD = """
+import sys, json, time
+started = time.perf_counter()
+from main import create_app
+imported = time.perf_counter()
+create_app()
+created = time.perf_counter()
+print(json.dumps([(imported - started) * 1000, (created - imported) * 1000,
+                  sorted(name for name in ('flask_admin', 'alembic', 'flask_migrate', 'requests') if name in sys.modules)]))
+"""
+MODES = {
+    "full": {'ADMIN_ENABLED': '1', 'MIGRATE_ENABLED': '1'},
+    "api_only": {'ADMIN_ENABLED': '0', 'MIGRATE_ENABLED': '0'},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per mode')
+    parser.add_argument('--output')
+    return parser.parse_args()
+
+
+def cold_start(env):
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=SRC, env=env, check=True,
+                            stdout=subprocess.PIPE).stdout
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    results = {}
+    for mode, settings in MODES.items():
+        env = dict(os.environ, DB_CONNECTION_STRING=os.environ.get('DB_CONNECTION_STRING', 'sqlite://'), **settings)
+        # the first run warms the .pyc files and the OS file cache, it isn't counted
+        cold_start(env)
+        runs = [cold_start(env) for _ in range(args.runs)]
+        import_ms = [run[0] for run in runs]
+        create_ms = [run[1] for run in runs]
+        results[mode] = {
+            "import_ms": round(statistics.median(import_ms), 1),
+            "create_app_ms": round(statistics.median(create_ms), 1),
+            "total_ms": round(statistics.median([a + b for a, b in zip(import_ms, create_ms)]), 1),
+            "loaded": runs[0][2],
+        }
+        print('%-8s %s' % (mode, results[mode]), file=sys.stderr)
+
+    report = {
+        "config": {"runs": args.runs, "python": sys.version.split()[0]},
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,18 +2,127 @@ import os
 from flask_admin import Admin
 from models import db, User, Favorite, Character, Planet
 from flask_admin.contrib.sqla import ModelView
+from sqlalchemy import text
+from sqlalchemy.orm import Query
+from cache import LRUCache
+from passwords import is_hashed
+
+# below this many rows an exact COUNT(*) is cheap enough, above it the planner's estimate is used
+EXACT_COUNT_LIMIT = 100000
+ESTIMATED_COUNT_SQL = {
+    'postgresql': "SELECT reltuples FROM pg_class WHERE relname = :table",
+    'mysql': "SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = :table",
+}
+
+
+def estimated_count(session, table):
+    sql = ESTIMATED_COUNT_SQL.get(session.get_bind().dialect.name)
+    if sql is None:
+        return None
+    estimate = session.execute(text(sql), {"table": table}).scalar()
+    # postgres says -1 for a table that was never analyzed
+    if estimate is None or estimate < EXACT_COUNT_LIMIT:
+        return None
+    return int(estimate)
+
+
+class CachedCountQuery:
+    """Stands in for the COUNT(*) query of a list view. The same count (same filters and
+    search) runs at most once per TTL, and the unfiltered count of a big table is the
+    database's estimate instead of a full scan."""
+
+    def __init__(self, query, table, counts, filtered=False):
+        self.query = query
+        self.table = table
+        self.counts = counts
+        self.filtered = filtered
+
+    def __getattr__(self, name):
+        # filter(), join()... keep wrapping the query they return
+        attribute = getattr(self.query, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            if isinstance(result, Query):
+                return CachedCountQuery(result, self.table, self.counts, filtered=True)
+            return result
+        return call
+
+    def scalar(self):
+        statement = self.query.statement.compile()
+        key = str(statement) + repr(sorted(statement.params.items()))
+        count = self.counts.get(key)
+        if count is None:
+            if not self.filtered:
+                count = estimated_count(self.query.session, self.table)
+            if count is None:
+                count = self.query.scalar()
+            self.counts.set(key, count)
+        return count
+
+
+class AdminView(ModelView):
+    """Lists that stay cheap on big tables: bounded pages, cached counts and sorting only
+    on indexed columns (every view sets column_sortable_list)."""
+
+    can_set_page_size = False
+    column_default_sort = ('id', True)
+
+    def __init__(self, model, session, page_size, count_ttl, **kwargs):
+        self.page_size = page_size
+        self.counts = LRUCache(max_entries=256, ttl=count_ttl)
+        super().__init__(model, session, **kwargs)
+
+    def get_count_query(self):
+        return CachedCountQuery(super().get_count_query(), self.model.__tablename__, self.counts)
+
+    def after_model_change(self, form, model, is_created):
+        self.counts.clear()
+
+    def after_model_delete(self, model):
+        self.counts.clear()
+
+class UserView(AdminView):
+    column_sortable_list = ('id', 'username', 'email')
+    column_exclude_list = ('password',)
+    # the favorites field would load every favorite of the user into a select box
+    form_excluded_columns = ('users',)
+
+    def on_model_change(self, form, model, is_created):
+        # a password typed in the admin is stored hashed like the ones from /signup
+        if not is_hashed(model.password):
+            model.set_password(model.password)
+
+class FavoriteView(AdminView):
+    column_list = ('id', 'user', 'character', 'planet')
+    # one LEFT JOIN per relationship instead of three lookups per row
+    column_select_related_list = ('user', 'character', 'planet')
+    # user_id leads the unique indexes, see the migration c5b19e07d842
+    column_sortable_list = ('id', ('user', Favorite.user_id))
+    # a select box with every user doesn't scale, users are looked up as you type
+    form_ajax_refs = {'user': {'fields': ('username',), 'page_size': 10}}
+
+class CharacterView(AdminView):
+    column_sortable_list = ('id', 'name', 'gender')
+    form_excluded_columns = ('characters',)
+
+class PlanetView(AdminView):
+    column_sortable_list = ('id', 'name', 'climate', 'terrain')
+    form_excluded_columns = ('planets',)
 
 def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
+    options = {'page_size': app.config['ADMIN_PAGE_SIZE'], 'count_ttl': app.config['ADMIN_COUNT_TTL']}
     # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(Favorite, db.session))
-    admin.add_view(ModelView(Character, db.session))
-    admin.add_view(ModelView(Planet, db.session))
+    admin.add_view(UserView(User, db.session, **options))
+    admin.add_view(FavoriteView(Favorite, db.session, **options))
+    admin.add_view(CharacterView(Character, db.session, **options))
+    admin.add_view(PlanetView(Planet, db.session, **options))
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(AdminView(YourModelName, db.session, **options))
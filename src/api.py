@@ -0,0 +1,431 @@
+"""
+The API endpoints, registered on the app by main.create_app. The caches they share
+are created there too and looked up in current_app.extensions.
+"""
+import re
+import hashlib
+from datetime import timedelta
+from flask import Blueprint, current_app, request, jsonify, g, stream_with_context
+from flask_jwt_extended import create_access_token, current_user, jwt_required, JWTManager
+from sqlalchemy import or_, inspect
+from sqlalchemy.exc import IntegrityError
+from utils import APIException, generate_sitemap, conditional_response
+from identity import CurrentUser
+from routing import mark_writer
+from compression import stream_json_array
+from ratelimit import rate_limited, client_ip, json_username
+import encoding
+from models import db, User, Favorite, FavoriteSummary, Character, Planet, insert_ignore, project, column_names
+
+EMAIL_FORMAT = re.compile(r'^(\w|\.|\_|\-)+[@](\w|\_|\-|\.)+[.]\w{2,8}$')
+PASSWORD_FORMAT = re.compile(r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[\W])[^\n\t]{8,20}$')
+
+api = Blueprint('api', __name__)
+jwt = JWTManager()
+
+# checked before the views touch the database, so a flood costs one bucket lookup per request
+auth_rate_limit = rate_limited(('RATE_LIMIT_PER_IP', client_ip), ('RATE_LIMIT_PER_USERNAME', json_username))
+
+def catalog_key(model, id):
+    return '%s:%s' % (model.__tablename__, id)
+
+def preload_catalog(app):
+    """Encodes every character and planet into the catalog cache as pinned entries, they
+    stay until the row changes. Run by wsgi.py and asgi.py before a worker takes requests."""
+    if not app.config['CATALOG_PRELOAD']:
+        return
+    catalog_cache = app.extensions['catalog_cache']
+    with app.app_context():
+        for model in (Character, Planet):
+            names = column_names(model)
+            for row in project(model, names).yield_per(500):
+                item = dict(zip(names, row))
+                catalog_cache.pin(catalog_key(model, item['id']), catalog_entry([item]))
+
+def catalog_entry(rows):
+    body = encoding.encode(rows)
+    etag = hashlib.sha1(body).hexdigest().encode('ascii')
+    # no Last-Modified: the rows have no modification date, and the time an entry was
+    # built differs between workers, the ETag alone makes the responses conditional
+    return etag + b'\n' + body
+
+def split_catalog_entry(entry):
+    """Returns the body and etag of a catalog cache entry."""
+    header, body = entry.split(b'\n', 1)
+    # entries cached in redis before Last-Modified was dropped have " <built at>" after the etag
+    return body, header.split(b' ', 1)[0].decode('ascii')
+
+def cached_catalog_response(model, id):
+    catalog_cache = current_app.extensions['catalog_cache']
+    entry = catalog_cache.get(catalog_key(model, id))
+    if entry is None:
+        names = column_names(model)
+        rows = [dict(zip(names, row)) for row in project(model, names).filter(model.id == id)]
+        entry = catalog_entry(rows)
+        # misses are not cached so rows added by the importer show up right away
+        if rows:
+            catalog_cache.set(catalog_key(model, id), entry)
+    return conditional_response(*split_catalog_entry(entry))
+
+@jwt.user_identity_loader
+def user_identity_lookup(user):
+    return user.id
+
+@jwt.additional_claims_loader
+def user_claims(user):
+    if current_app.config['JWT_EMBED_USER_CLAIMS']:
+        return {"is_active": user.is_active}
+    return {}
+
+@jwt.user_lookup_loader
+def user_lookup_callback(_jwt_header, jwt_data):
+    identity = jwt_data["sub"]
+    # the claim is only trusted while the app embeds it, so turning JWT_EMBED_USER_CLAIMS
+    # off makes tokens issued before go back to the database
+    if current_app.config['JWT_EMBED_USER_CLAIMS'] and "is_active" in jwt_data:
+        user = CurrentUser(identity, jwt_data["is_active"])
+    else:
+        identity_cache = current_app.extensions['identity_cache']
+        user = identity_cache.get(identity, jwt_data["jti"])
+        if user is None:
+            row = User.query.filter_by(id=identity).one_or_none()
+            if row is None and g.get('use_replica'):
+                # a user who just signed up may not be on the replica yet, the rest of
+                # the request reads from the primary too
+                g.use_replica = False
+                row = User.query.filter_by(id=identity).one_or_none()
+            if row is None:
+                return None
+            user = CurrentUser(row.id, row.is_active)
+            identity_cache.set(identity, jwt_data["jti"], user)
+    # returning None makes flask_jwt_extended answer 401
+    if user.is_active is False:
+        return None
+    return user
+
+# Handle/serialize errors like a JSON object
+@api.app_errorhandler(APIException)
+def handle_invalid_usage(error):
+    return jsonify(error.to_dict()), error.status_code
+
+# generate sitemap with all your endpoints
+@api.route('/')
+def sitemap():
+    return generate_sitemap(current_app)
+
+@api.route('/signup', methods=['POST'])
+@auth_rate_limit
+def create_user():
+
+    request_body = request.get_json()
+    error_messages=[]
+
+    if 'username' not in request_body:
+        error_messages.append({"msg":"Username required"})
+    if 'email' not in request_body:
+        error_messages.append({"msg":"Email required"})
+    if 'password' not in request_body:
+        error_messages.append({"msg":"Password required"})
+    if len(error_messages) > 0:
+        return jsonify(error_messages), 400       
+
+    if not EMAIL_FORMAT.match(request_body['email']):
+        error_messages.append({'msg':'Enter a valid email format'})
+    if not PASSWORD_FORMAT.match(request_body['password']):
+        error_messages.append({'msg':'Password must contain the following: a lowercase letter, a capital letter, a number, one special character and minimum 8 characters'})
+    if len(error_messages) > 0:
+        return jsonify(error_messages), 400
+
+    user = User()
+    user.username = request_body['username']
+    user.email = request_body['email']
+    user.set_password(request_body['password'])
+    user.is_active=True
+
+    # the unique constraints decide, so two signups racing for a username can't both win.
+    # Only a failed INSERT pays for the lookup that says which field was taken.
+    db.session.add(user)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        taken = db.session.query(User.username, User.email).filter(
+            or_(User.username == request_body['username'], User.email == request_body['email'])).all()
+        if any(row.username == request_body['username'] for row in taken):
+            error_messages.append({'msg': 'This username already exists. Check your username'})
+        if any(row.email == request_body['email'] for row in taken):
+            error_messages.append({'msg': 'This email already exists. Check your email'})
+        return jsonify(error_messages), 400
+    # the id from the identity map, reading user.id would reload the expired row
+    mark_writer(inspect(user).identity[0])
+
+    #user = User.query.filter_by(username=user.username).first()
+
+    #favorite = Favorite()
+    #favorite.user_id = user.id
+
+    #db.session.add(favorite)
+    #db.session.commit()
+
+    response_body = {
+        "msg": "The user was successfully created."
+    }
+
+    return jsonify(response_body), 200
+
+
+@api.route("/login", methods=["POST"])
+@auth_rate_limit
+def login():
+    username = request.json.get("username", None)
+    password = request.json.get("password", None)
+    error_messages=[]
+    
+    if username is None:
+        error_messages.append({"msg": "Username is required"})
+    if password is None:
+        error_messages.append({"msg": "Password is required"})
+    if len(error_messages) > 0:
+        return jsonify(error_messages), 400
+
+    user = User.query.filter_by(username=username).one_or_none()
+
+    if not user:
+        return jsonify({"msg": "Username doesn't exist"}), 400
+    if not user.check_password(password):
+        return jsonify({"msg": "Invalid password"}), 401
+    # the new token's first reads go to the primary, which has the user for sure
+    mark_writer(user.id)
+    if user.password_needs_rehash():
+        # plain passwords and hashes made with an older cost get upgraded here
+        user.set_password(password)
+        db.session.commit()
+
+    expiration = timedelta(days=1)
+    access_token = create_access_token(identity=user, expires_delta=expiration)
+    return jsonify('The login has been successful.', {'token':access_token}), 200
+
+
+# Protect a route with jwt_required, which will kick out requests
+# without a valid JWT present.
+@api.route("/favorites", methods=["GET"])
+@jwt_required()
+def get_favorites():
+
+    summary = FavoriteSummary.stored(current_user.id)
+    if summary is not None:
+        response = conditional_response(*summary)
+    else:
+        rows = Favorite.rows_for_user(current_user.id)
+        first_rows = rows.fetchmany(current_app.config['STREAM_THRESHOLD'])
+        if len(first_rows) < current_app.config['STREAM_THRESHOLD']:
+            values = FavoriteSummary.values(current_user.id, Favorite.serialize_rows(first_rows))
+            # stored unless this request reads from the replica
+            if not g.get('use_replica'):
+                FavoriteSummary.store(values)
+            response = conditional_response(values['body'], values['etag'])
+        else:
+            # too long to build in memory, the next change or `flask rebuild-favorites` stores it
+            items = (Favorite.serialize_row(row) for row in rows)
+            body = stream_json_array(items, encoding.encode, first_items=Favorite.serialize_rows(first_rows))
+            response = current_app.response_class(stream_with_context(body), mimetype='application/json')
+            response.headers['Cache-Control'] = current_app.config['CACHE_CONTROL']['api.get_favorites']
+    response.vary.add('Authorization')
+    return response
+
+
+@api.route("/favorites", methods=["POST"])
+@jwt_required()
+def add_favorite():
+
+    #favorites_db = Favorite.query.filter_by(user_id=current_user.id)
+    #favorites_db = list(map(lambda favorite: favorite.serialize(), favorites_db))
+    #favorite_list = []
+
+    #for i in favorites_db:
+    #    favorite_list.append(i['character_id'])
+
+    newCharacter = request.json.get('character_id', None)
+    newPlanet = request.json.get('planet_id', None)
+
+    # saving a favorite the user already has is a no-op, not a unique index error
+    added = []
+    if newCharacter is not None and newCharacter >= 0:
+        db.session.execute(insert_ignore(Favorite), {"user_id": current_user.id, "character_id": newCharacter, "planet_id": None})
+        added.append((newCharacter, None))
+    if newPlanet:
+        db.session.execute(insert_ignore(Favorite), {"user_id": current_user.id, "character_id": None, "planet_id": newPlanet})
+        added.append((None, newPlanet))
+    if added:
+        FavoriteSummary.update(current_user.id, added=added)
+        db.session.commit()
+
+    print(False)
+    return jsonify(True),200
+
+    #newFavorite = Favorite(user_id=current_user.id, character_id = favorite['character_id'])
+
+    #favorite_list.append(newFavorite.character_id)
+
+    #db.session.add(favorite_list)
+    #db.session.commit()
+
+    #return jsonify(newFavorite.serialize()), 200
+
+
+def bulk_favorite_ids():
+    """Reads {"character_ids": [...], "planet_ids": [...]} from the request body,
+    returns the two sets of ids and a list of error messages."""
+    request_body = request.get_json(silent=True)
+    if not isinstance(request_body, dict):
+        return set(), set(), [{"msg": "The body must be a JSON object"}]
+    error_messages = []
+    ids = {}
+    for name in ('character_ids', 'planet_ids'):
+        values = request_body.get(name, [])
+        if not isinstance(values, list) or not all(type(value) is int for value in values):
+            error_messages.append({"msg": name + " must be a list of ids"})
+            values = []
+        ids[name] = set(values)
+    total = len(ids['character_ids']) + len(ids['planet_ids'])
+    if total == 0 and not error_messages:
+        error_messages.append({"msg": "character_ids or planet_ids required"})
+    if total > current_app.config['MAX_BULK_FAVORITES']:
+        error_messages.append({"msg": "At most %d ids per request" % current_app.config['MAX_BULK_FAVORITES']})
+    return ids['character_ids'], ids['planet_ids'], error_messages
+
+def user_favorites_filter(character_ids, planet_ids):
+    return db.and_(Favorite.user_id == current_user.id, db.or_(
+        Favorite.character_id.in_(character_ids),
+        Favorite.planet_id.in_(planet_ids),
+    ))
+
+
+@api.route("/favorites/bulk", methods=["POST"])
+@jwt_required()
+def add_favorites_bulk():
+
+    character_ids, planet_ids, error_messages = bulk_favorite_ids()
+    if len(error_messages) > 0:
+        return jsonify(error_messages), 400
+
+    # one IN query per table to reject ids that don't exist
+    unknown_characters = character_ids - set(id for (id,) in db.session.query(Character.id).filter(Character.id.in_(character_ids)))
+    unknown_planets = planet_ids - set(id for (id,) in db.session.query(Planet.id).filter(Planet.id.in_(planet_ids)))
+    if unknown_characters:
+        error_messages.append({"msg": "Unknown character ids", "ids": sorted(unknown_characters)})
+    if unknown_planets:
+        error_messages.append({"msg": "Unknown planet ids", "ids": sorted(unknown_planets)})
+    if len(error_messages) > 0:
+        return jsonify(error_messages), 400
+
+    for character_id, planet_id in db.session.query(Favorite.character_id, Favorite.planet_id).filter(user_favorites_filter(character_ids, planet_ids)):
+        character_ids.discard(character_id)
+        planet_ids.discard(planet_id)
+
+    rows = [{"user_id": current_user.id, "character_id": id, "planet_id": None} for id in sorted(character_ids)]
+    rows += [{"user_id": current_user.id, "character_id": None, "planet_id": id} for id in sorted(planet_ids)]
+    if rows:
+        # a single multi-row INSERT, duplicates from a concurrent request are skipped by the unique indexes
+        db.session.execute(insert_ignore(Favorite), rows)
+        FavoriteSummary.update(current_user.id, added=[(row['character_id'], row['planet_id']) for row in rows])
+        db.session.commit()
+
+    return jsonify({"added": len(rows)}), 200
+
+
+@api.route("/favorites/bulk", methods=["DELETE"])
+@jwt_required()
+def remove_favorites_bulk():
+
+    character_ids, planet_ids, error_messages = bulk_favorite_ids()
+    if len(error_messages) > 0:
+        return jsonify(error_messages), 400
+
+    removed = Favorite.query.filter(user_favorites_filter(character_ids, planet_ids)).delete(synchronize_session=False)
+    if removed:
+        FavoriteSummary.update(current_user.id, removed=[(id, None) for id in character_ids] + [(None, id) for id in planet_ids])
+    db.session.commit()
+
+    return jsonify({"removed": removed}), 200
+
+
+@api.route("/character/<int:id>", methods=["GET"])
+def get_character(id):
+
+    return cached_catalog_response(Character, id)
+
+
+@api.route("/planet/<int:id>", methods=["GET"])
+def get_planet(id):
+
+    return cached_catalog_response(Planet, id)
+
+# filters only go on indexed columns, see the migration 3a7c91d2b4e5
+CHARACTER_FILTERS = ('name', 'gender')
+PLANET_FILTERS = ('name', 'climate', 'terrain')
+
+def list_catalog(model, filters):
+    limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+    after = request.args.get('after', 0, type=int)
+    fields = request.args.get('fields')
+    if fields:
+        fields = fields.split(',')
+        unknown = [field for field in fields if field not in model.__table__.columns]
+        if unknown:
+            return jsonify({"msg": "Unknown fields: " + ", ".join(unknown)}), 400
+
+    # only the requested columns are read, plus id for the cursor
+    names = fields or column_names(model)
+    columns = names if 'id' in names else names + ['id']
+
+    # keyset pagination: the cursor is the last id of the previous page
+    query = project(model, columns).filter(model.id > after)
+    for name in filters:
+        if name in request.args:
+            query = query.filter(getattr(model, name) == request.args[name])
+    query = query.order_by(model.id).limit(limit)
+
+    results = []
+    last_id = None
+    for row in query.yield_per(100):
+        item = dict(zip(columns, row))
+        last_id = item['id']
+        if 'id' not in names:
+            del item['id']
+        results.append(item)
+
+    body = encoding.encode({
+        "results": results,
+        "next": last_id if len(results) == limit else None,
+    })
+    return current_app.response_class(body, mimetype='application/json'), 200
+
+
+@api.route("/characters", methods=["GET"])
+def get_characters():
+
+    return list_catalog(Character, CHARACTER_FILTERS)
+
+
+@api.route("/planets", methods=["GET"])
+def get_planets():
+
+    return list_catalog(Planet, PLANET_FILTERS)
+
+@api.route("/search", methods=["GET"])
+def search():
+
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify({"msg": "q required"}), 400
+    limit = request.args.get('limit', current_app.config['SEARCH_MAX_RESULTS'], type=int)
+    limit = max(1, min(limit, current_app.config['SEARCH_MAX_RESULTS']))
+
+    # built from the database the first time it's needed, then kept current by on_commit
+    # and refreshed in the background when other processes change the tables (see SearchIndex)
+    search_index = current_app.extensions['search_index']
+    search_index.build()
+    body = encoding.encode(search_index.search(query, limit))
+    return current_app.response_class(body, mimetype='application/json'), 200
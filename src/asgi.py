@@ -0,0 +1,164 @@
+"""
+ASGI entry point, an alternative to wsgi.py for serving the API with uvicorn:
+
+$ uvicorn asgi:application --app-dir src
+
+GET /favorites, /character/<id> and /planet/<id> are answered by async handlers on
+an async SQLAlchemy engine, so one process keeps hundreds of them waiting on the
+database at the same time. Every other route (signup, login, admin...) is passed to
+the Flask app through asgiref's WsgiToAsgi, which runs it in a thread.
+
+Needs `pipenv install uvicorn asgiref` plus the async driver of your database:
+asyncpg (postgres), aiomysql (mysql) or aiosqlite (sqlite). The async URL is built
+from DB_CONNECTION_STRING, set ASYNC_DB_CONNECTION_STRING to override it.
+"""
+import os
+import re
+import hashlib
+import jwt as pyjwt
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from flask_jwt_extended import decode_token
+from main import create_app
+from api import catalog_key, catalog_entry, split_catalog_entry, preload_catalog
+from identity import CurrentUser
+from models import User, Favorite, FavoriteSummary, Character, Planet, column_names
+import encoding
+
+ASYNC_DRIVERS = {
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+}
+CATALOG_ROUTE = re.compile(r'^/(character|planet)/(\d+)/?$')
+CATALOG_MODELS = {'character': Character, 'planet': Planet}
+
+app = create_app()
+preload_catalog(app)
+catalog_cache = app.extensions['catalog_cache']
+identity_cache = app.extensions['identity_cache']
+# the handlers run outside the Flask app context, so the app's encoder is looked up once here
+encode = encoding.encoder(app.config['JSON_ENCODER_NAME'])
+
+
+def async_url(url):
+    scheme, rest = url.split('://', 1)
+    return ASYNC_DRIVERS[scheme.split('+')[0]] + '://' + rest
+
+engine = create_async_engine(os.environ.get('ASYNC_DB_CONNECTION_STRING') or async_url(app.config['SQLALCHEMY_DATABASE_URI']))
+Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+flask_application = WsgiToAsgi(app)
+
+
+def request_header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+async def send_json(send, status, body, headers=None):
+    headers = dict(headers or {})
+    headers.setdefault('Content-Type', 'application/json')
+    headers['Access-Control-Allow-Origin'] = '*'
+    if status != 304:
+        headers['Content-Length'] = str(len(body))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(key.encode('latin-1'), value.encode('latin-1')) for key, value in headers.items()],
+    })
+    await send({'type': 'http.response.body', 'body': body if status != 304 else b''})
+
+async def send_conditional(scope, send, body, etag, endpoint, headers=None):
+    """Same headers and 304 handling as utils.conditional_response."""
+    headers = dict(headers or {})
+    headers['ETag'] = '"%s"' % etag
+    cache_control = app.config['CACHE_CONTROL'].get(endpoint)
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+    if_none_match = request_header(scope, b'if-none-match') or ''
+    matched = if_none_match.strip() == '*' or headers['ETag'] in [tag.strip().lstrip('W/') for tag in if_none_match.split(',')]
+    await send_json(send, 304 if matched else 200, body, headers)
+
+
+async def current_user(scope, session):
+    """Async version of api.user_lookup_callback, returns (user, error message)."""
+    authorization = request_header(scope, b'authorization')
+    if not authorization or not authorization.startswith('Bearer '):
+        return None, 'Missing Authorization Header'
+    try:
+        with app.app_context():
+            jwt_data = decode_token(authorization[len('Bearer '):])
+    except pyjwt.ExpiredSignatureError:
+        return None, 'Token has expired'
+    except pyjwt.InvalidTokenError:
+        return None, 'Invalid token'
+
+    identity = jwt_data['sub']
+    if app.config['JWT_EMBED_USER_CLAIMS'] and 'is_active' in jwt_data:
+        user = CurrentUser(identity, jwt_data['is_active'])
+    else:
+        user = identity_cache.get(identity, jwt_data['jti'])
+        if user is None:
+            row = (await session.execute(select(User.id, User.is_active).where(User.id == identity))).first()
+            if row is None:
+                return None, 'Error loading the user %s' % identity
+            user = CurrentUser(row.id, row.is_active)
+            identity_cache.set(identity, jwt_data['jti'], user)
+    if user.is_active is False:
+        return None, 'Error loading the user %s' % identity
+    return user, None
+
+async def get_favorites(scope, send):
+    async with Session() as session:
+        user, error = await current_user(scope, session)
+        if user is None:
+            return await send_json(send, 401, encode({"msg": error}))
+        summary = (await session.execute(select(FavoriteSummary.body, FavoriteSummary.etag).where(FavoriteSummary.user_id == user.id))).first()
+        if summary is not None:
+            body, etag = summary
+        else:
+            # built but not stored, the Flask side stores summaries (see api.get_favorites)
+            rows = await session.execute(Favorite.rows_for_user_statement(user.id))
+            body = encode(Favorite.serialize_rows(rows))
+            etag = hashlib.sha1(body).hexdigest()
+    await send_conditional(scope, send, body, etag, 'api.get_favorites', {'Vary': 'Authorization'})
+
+async def get_catalog(scope, send, model, id):
+    entry = catalog_cache.get(catalog_key(model, id))
+    if entry is None:
+        names = column_names(model)
+        async with Session() as session:
+            result = await session.execute(select(*[getattr(model, name) for name in names]).where(model.id == id))
+            rows = [dict(zip(names, row)) for row in result]
+        with app.app_context():
+            entry = catalog_entry(rows)
+        if rows:
+            catalog_cache.set(catalog_key(model, id), entry)
+    body, etag = split_catalog_entry(entry)
+    await send_conditional(scope, send, body, etag, 'api.get_' + model.__tablename__)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        path = scope['path']
+        if path.rstrip('/') == '/favorites':
+            return await get_favorites(scope, send)
+        match = CATALOG_ROUTE.match(path)
+        if match:
+            return await get_catalog(scope, send, CATALOG_MODELS[match.group(1)], int(match.group(2)))
+
+    await flask_application(scope, receive, send)
@@ -0,0 +1,238 @@
+import time
+import threading
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+
+class LRUCache:
+    """In-process cache with a max size (least recently used goes first) and a TTL per entry.
+    Pinned entries don't count towards the size and never expire, only delete() and
+    clear() drop them."""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._pinned = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._pinned.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pin(self, key, value):
+        with self._lock:
+            self._pinned[key] = value
+            self._entries.pop(key, None)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._pinned.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries) + len(self._pinned),
+        }
+
+
+class RedisCache:
+    """Same interface as LRUCache on top of any client exposing get, set(ex=) and delete,
+    e.g. redis.Redis or a local fake. Values must be bytes. Evictions happen on the
+    server, so they are not counted here."""
+
+    def __init__(self, client, ttl=300, prefix="flask-rest:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._keys = set()
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+        self._keys.add(key)
+
+    def pin(self, key, value):
+        # no expiry, deleted by the invalidation like the other entries
+        self.client.set(self.prefix + key, value)
+        self._keys.add(key)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+        self._keys.discard(key)
+
+    def clear(self):
+        # Only the keys this process wrote are known, the rest expire with their TTL.
+        for key in list(self._keys):
+            self.delete(key)
+
+    def stats(self):
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class VersionedCache:
+    """A process-local cache (LRUCache) that learns about the writes of other processes.
+
+    delete() also bumps a version shared by every process, and get() reads that
+    version at most once every `check_seconds`: when it moved, some process changed
+    a row and every entry is dropped. Entries are stale for `check_seconds` at most
+    instead of for their whole TTL. Pinned entries are dropped as well, the rows are
+    cached again on their next read. `read_version` and `bump_version` are callables
+    taking no arguments, e.g. on top of models.CacheVersion.
+    """
+
+    def __init__(self, cache, read_version, bump_version, check_seconds=2):
+        self.cache = cache
+        self.read_version = read_version
+        self.bump_version = bump_version
+        self.check_seconds = check_seconds
+        self.version = None
+        self.checked_at = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.checked_at is not None and now - self.checked_at < self.check_seconds:
+                return
+            self.checked_at = now
+        version = self.read_version()
+        with self._lock:
+            if self.version is not None and version != self.version:
+                self.cache.clear()
+            self.version = version
+
+    def get(self, key):
+        self.check()
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value)
+
+    def pin(self, key, value):
+        # the version the entry was built under, later changes must still clear it
+        self.check()
+        self.cache.pin(key, value)
+
+    def delete(self, key):
+        self.cache.delete(key)
+        self.bump_version()
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return self.cache.stats()
+
+
+def create_cache(config, read_version=None, bump_version=None):
+    """Redis when CACHE_REDIS_URL is set, shared by every process. Otherwise an LRUCache
+    per process, wrapped in a VersionedCache when a shared version is given."""
+    ttl = config.get('CACHE_TTL', 300)
+    redis_url = config.get('CACHE_REDIS_URL')
+    if redis_url:
+        import redis
+        return RedisCache(redis.Redis.from_url(redis_url), ttl=ttl)
+    cache = LRUCache(max_entries=config.get('CACHE_MAX_ENTRIES', 1024), ttl=ttl)
+    if read_version is None:
+        return cache
+    return VersionedCache(cache, read_version, bump_version, check_seconds=config.get('CACHE_CHECK_SECONDS', 2))
+
+
+# Commit hooks: callbacks registered with on_commit(app, Model, callback) run as
+# callback(Model, values, deleted) once a transaction that inserted, updated or
+# deleted a Model row is committed. This covers the API routes and the
+# Flask-Admin views alike since both go through db.session. Row values are
+# captured at flush time because the session can't load them after the commit.
+# Callbacks belong to an app (app.extensions) and only run for commits made in
+# its context, so apps built side by side (tests, benchmarks) don't see each other.
+
+def on_commit(app, model, callback):
+    app.extensions.setdefault('commit_callbacks', {}).setdefault(model, []).append(callback)
+
+def _app_callbacks():
+    if not has_app_context():
+        return {}
+    return current_app.extensions.get('commit_callbacks', {})
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    callbacks = _app_callbacks()
+    if not callbacks:
+        return
+    pending = session.info.setdefault('commit_changes', [])
+    for deleted, instances in ((False, session.new), (False, session.dirty), (True, session.deleted)):
+        for instance in instances:
+            if type(instance) not in callbacks:
+                continue
+            mapper = inspect(instance).mapper
+            values = {attr.key: getattr(instance, attr.key) for attr in mapper.column_attrs}
+            pending.append((type(instance), values, deleted))
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_callbacks(session):
+    pending = session.info.pop('commit_changes', [])
+    callbacks = _app_callbacks() if pending else {}
+    for model, values, deleted in pending:
+        for callback in callbacks.get(model, ()):
+            callback(model, values, deleted)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_callbacks(session):
+    session.info.pop('commit_changes', None)
@@ -0,0 +1,122 @@
+"""
+Response compression and JSON streaming.
+
+Responses are compressed with brotli when the package is installed and the client
+accepts it, gzip otherwise (stdlib zlib). Bodies under COMPRESS_MIN_SIZE bytes are
+sent as they are, compressing them costs more than it saves. Streamed responses
+are compressed chunk by chunk so they stay streamed.
+"""
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript')
+# bytes a stream gathers before sending them on, every flush ends a compression block
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+class GzipCompressor:
+    def __init__(self, level):
+        # wbits=31 writes the gzip header and trailer
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush(zlib.Z_FINISH)
+
+class BrotliCompressor:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+COMPRESSORS = {'gzip': GzipCompressor}
+if brotli is not None:
+    COMPRESSORS['br'] = BrotliCompressor
+
+
+def choose_encoding():
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in COMPRESSORS and accepted[encoding]:
+            return encoding
+    return None
+
+def compress_stream(chunks, compressor):
+    # flushing after every small chunk would compress each one on its own,
+    # so the output is only flushed once STREAM_CHUNK_SIZE bytes went in
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= STREAM_CHUNK_SIZE:
+            data += compressor.flush()
+            pending = 0
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def stream_json_array(items, encode, first_items=()):
+    """Yields a JSON array in chunks of about STREAM_CHUNK_SIZE bytes, so the whole
+    list is never in memory."""
+    buffer = [b'[']
+    size = 0
+    separator = b''
+    for items_part in (first_items, items):
+        for item in items_part:
+            data = separator + encode(item)
+            separator = b','
+            buffer.append(data)
+            size += len(data)
+            if size >= STREAM_CHUNK_SIZE:
+                yield b''.join(buffer)
+                buffer = []
+                size = 0
+    buffer.append(b']')
+    yield b''.join(buffer)
+
+
+def setup_compression(app):
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding()
+        if encoding is None:
+            return response
+        level = app.config['COMPRESS_LEVEL']
+        compressor = COMPRESSORS[encoding](level)
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, compressor)
+        else:
+            body = response.get_data()
+            if len(body) < app.config['COMPRESS_MIN_SIZE']:
+                return response
+            response.set_data(compressor.compress(body) + compressor.finish())
+        response.headers['Content-Encoding'] = encoding
+        # the compressed bytes differ from what the ETag was computed on
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,41 @@
+"""
+JSON encoding for the API responses.
+
+orjson is used when it is installed (`pipenv install orjson`) and the standard
+library otherwise. Both write compact UTF-8 with sorted keys and non-ASCII
+characters left unescaped (jsonify escapes them), so for the strings,
+numbers, lists and dicts the API returns, switching encoders changes neither the
+response bodies nor their ETags.
+"""
+import json
+from flask import current_app, has_app_context
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_json(obj):
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def encode_orjson(obj):
+    return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+
+ENCODERS = {'json': encode_json}
+if orjson is not None:
+    ENCODERS['orjson'] = encode_orjson
+
+
+def encoder(name='auto'):
+    """'auto' picks the fastest encoder installed, 'json' or 'orjson' force one."""
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in ENCODERS else 'json'
+    if name not in ENCODERS:
+        raise ValueError('JSON encoder %r is not available, use one of: %s' % (name, ', '.join(ENCODERS)))
+    return ENCODERS[name]
+
+def encode(obj):
+    """Encodes with the current app's JSON_ENCODER_NAME, 'auto' outside an app."""
+    name = current_app.config.get('JSON_ENCODER_NAME', 'auto') if has_app_context() else 'auto'
+    return encoder(name)(obj)
@@ -0,0 +1,34 @@
+from collections import namedtuple
+from cache import LRUCache
+
+# What an authenticated route gets as current_user. Only the columns needed to
+# authorize a request, so it can be cached or rebuilt from the token claims.
+CurrentUser = namedtuple('CurrentUser', ['id', 'is_active'])
+
+
+class IdentityCache:
+    """Users resolved from a JWT, keyed by the token "sub" and "jti".
+
+    invalidate(user_id) bumps a generation number that is part of the key, so
+    every cached token of that user misses on its next request. It only reaches
+    this process, other workers catch up when the short TTL runs out.
+    """
+
+    def __init__(self, max_entries=10000, ttl=30):
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.generations = {}
+
+    def key(self, sub, jti):
+        return '%s:%s:%d' % (sub, jti, self.generations.get(str(sub), 0))
+
+    def get(self, sub, jti):
+        return self.cache.get(self.key(sub, jti))
+
+    def set(self, sub, jti, user):
+        self.cache.set(self.key(sub, jti), user)
+
+    def invalidate(self, user_id):
+        self.generations[str(user_id)] = self.generations.get(str(user_id), 0) + 1
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,129 @@
+"""
+Loads the characters and planets from swapi.dev into the database, run it with `$ pipenv run import`
+"""
+import os
+import json
+import math
+import click
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, Character, Planet
+
+SWAPI_URL = 'https://swapi.dev/api/'
+
+
+def to_int(value):
+    # swapi uses strings like "1,000" or "unknown" for numbers, the columns don't allow nulls
+    try:
+        return int(value.replace(',', ''))
+    except (AttributeError, ValueError):
+        return 0
+
+def character_row(item):
+    return {
+        "name": item['name'],
+        "birth_day": item['birth_year'],
+        "gender": item['gender'],
+        "height": to_int(item['height']),
+        "skin_color": item['skin_color'],
+        "hair_color": item['hair_color'],
+        "eye_color": item['eye_color'],
+    }
+
+def planet_row(item):
+    return {
+        "name": item['name'],
+        "climate": item['climate'],
+        "population": item['population'],
+        "terrain": item['terrain'],
+        "rotation_period": to_int(item['rotation_period']),
+        "orbital_period": to_int(item['orbital_period']),
+        "diameter": to_int(item['diameter']),
+    }
+
+RESOURCES = {
+    'people': (Character, character_row),
+    'planets': (Planet, planet_row),
+}
+
+
+def swapi_client(config, workers=4):
+    # imported here so the web workers never load requests
+    from upstream import UpstreamClient
+    return UpstreamClient(
+        SWAPI_URL,
+        timeout=(config['UPSTREAM_CONNECT_TIMEOUT'], config['UPSTREAM_READ_TIMEOUT']),
+        retries=config['UPSTREAM_RETRIES'],
+        pool_size=workers,
+        cache_dir=config['UPSTREAM_CACHE_DIR'],
+    )
+
+def fetch_page(resource, page, fixtures=None, client=None):
+    # fixtures mirror the api: <fixtures>/<resource>/<page>.json
+    if fixtures:
+        with open(os.path.join(fixtures, resource, '%d.json' % page)) as f:
+            return json.load(f)
+    return client.get_json(resource + '/', params={'page': page})
+
+def save_page(model, to_row, results, existing_names):
+    rows = [to_row(item) for item in results if item['name'] not in existing_names]
+    if rows:
+        db.session.bulk_insert_mappings(model, rows)
+        db.session.commit()
+        existing_names.update(row['name'] for row in rows)
+    return len(rows)
+
+def import_resource(resource, workers=4, fixtures=None, client=None):
+    """Imports every page of a swapi resource and returns how many rows were inserted.
+
+    Rows are matched by name and each page is committed on its own, so running it
+    again skips what is already there and picks up whatever a failed run missed.
+    """
+    if client is None and not fixtures:
+        with swapi_client(current_app.config, workers) as client:
+            return import_resource(resource, workers, fixtures, client)
+    model, to_row = RESOURCES[resource]
+    existing_names = set(name for (name,) in db.session.query(model.name))
+
+    first_page = fetch_page(resource, 1, fixtures, client)
+    inserted = save_page(model, to_row, first_page['results'], existing_names)
+    if not first_page['results']:
+        return inserted
+
+    pages = math.ceil(first_page['count'] / len(first_page['results']))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # pages are downloaded concurrently but only this thread touches the session
+        for data in pool.map(lambda page: fetch_page(resource, page, fixtures, client), range(2, pages + 1)):
+            inserted += save_page(model, to_row, data['results'], existing_names)
+    return inserted
+
+
+@click.command('import-swapi')
+@click.option('--workers', default=4, show_default=True, help='Pages downloaded at the same time.')
+@click.option('--fixtures', type=click.Path(exists=True, file_okay=False), help='Read the pages from this folder instead of swapi.dev.')
+@click.option('--no-cache', is_flag=True, help='Download every page again instead of revalidating the cached ones.')
+@click.option('--if-empty', is_flag=True, help='Skip the resources whose table already has rows.')
+@with_appcontext
+def import_swapi_command(workers, fixtures, no_cache, if_empty):
+    resources = list(RESOURCES)
+    if if_empty:
+        # the release step runs it on every deploy, swapi.dev is only needed the first time
+        resources = [resource for resource in resources if db.session.query(RESOURCES[resource][0].id).first() is None]
+        for resource in RESOURCES:
+            if resource not in resources:
+                click.echo('%s: already imported, skipped' % resource)
+        if not resources:
+            return
+    config = dict(current_app.config)
+    if no_cache:
+        config['UPSTREAM_CACHE_DIR'] = None
+    client = None if fixtures else swapi_client(config, workers)
+    try:
+        for resource in resources:
+            inserted = import_resource(resource, workers=workers, fixtures=fixtures, client=client)
+            click.echo('%s: %d new rows' % (resource, inserted))
+    finally:
+        if client is not None:
+            click.echo('swapi.dev: %(requests)d requests, %(not_modified)d not modified' % client.stats)
+            client.close()
@@ -2,216 +2,148 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-import re
-import requests
-from datetime import timedelta
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+from flask import Flask
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from admin import setup_admin
-from models import db, User, Favorite, Character, Planet
-from flask_jwt_extended import create_access_token, current_user, get_jwt_identity, jwt_required, JWTManager
-
-app = Flask(__name__)
-app.url_map.strict_slashes = False
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DB_CONNECTION_STRING')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config["JWT_SECRET_KEY"] = "super-secret"  # Change this!
-jwt = JWTManager(app)
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
-setup_admin(app)
-
-@jwt.user_identity_loader
-def user_identity_lookup(user):
-    return user.id
-
-@jwt.user_lookup_loader
-def user_lookup_callback(_jwt_header, jwt_data):
-    identity = jwt_data["sub"]
-    return User.query.filter_by(id=identity).one_or_none()
-
-@app.before_first_request
-def characters_load():
-    characters = Character.query.all()
-    if not characters:
-        response_characters = requests.get("https://swapi.dev/api/people/")
-        json_response = response_characters.json()
-        for character in json_response['results']:
-            character_info=Character(name=character['name'], birth_day=character['birth_year'], gender = character['gender'], height = character['height'], skin_color = character['skin_color'], hair_color = character['hair_color'], eye_color = character['eye_color'])
-            db.session.add(character_info)
-        db.session.commit()
-
-@app.before_first_request
-def planets_load():
-    planets = Planet.query.all()
-    if not planets:
-        response_planets = requests.get("https://swapi.dev/api/planets")
-        json_response = response_planets.json()
-        for planet in json_response['results']:
-            planet_info=Planet(name=planet['name'], climate=planet['climate'], population = planet['population'], terrain = planet['terrain'], rotation_period = planet['rotation_period'], orbital_period = planet['orbital_period'], diameter = planet['diameter'])
-            db.session.add(planet_info)
-        db.session.commit()
-
-# Handle/serialize errors like a JSON object
-@app.errorhandler(APIException)
-def handle_invalid_usage(error):
-    return jsonify(error.to_dict()), error.status_code
-
-# generate sitemap with all your endpoints
-@app.route('/')
-def sitemap():
-    return generate_sitemap(app)
-
-@app.route('/signup', methods=['POST'])
-def create_user():
-
-    request_body = request.get_json()
-    error_messages=[]
-
-    if 'username' not in request_body:
-        error_messages.append({"msg":"Username required"})
-    if 'email' not in request_body:
-        error_messages.append({"msg":"Email required"})
-    if 'password' not in request_body:
-        error_messages.append({"msg":"Password required"})
-    if len(error_messages) > 0:
-        return jsonify(error_messages), 400       
-
-    if not re.match('^(\w|\.|\_|\-)+[@](\w|\_|\-|\.)+[.]\w{2,8}$', request_body['email']):
-        error_messages.append({'msg':'Enter a valid email format'})
-    if not re.match('^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[\W])[^\n\t]{8,20}$', request_body['password']):
-        error_messages.append({'msg':'Password must contain the following: a lowercase letter, a capital letter, a number, one special character and minimum 8 characters'})
-    if len(error_messages) > 0:
-        return jsonify(error_messages), 400
-
-    username = User.query.filter_by(username=request_body['username']).first()
-    email = User.query.filter_by(email=request_body['email']).first()
-
-    if username:
-        error_messages.append({'msg': 'This username already exists. Check your username'})
-    if email:
-        error_messages.append({'msg': 'This email already exists. Check your email'})
-    if len(error_messages) > 0:
-        return jsonify(error_messages), 400
-
-    user = User()
-    user.username = request_body['username']
-    user.email = request_body['email']
-    user.password = request_body['password']
-    user.is_active=True
-
-    db.session.add(user)
-    db.session.commit()
-
-    #user = User.query.filter_by(username=user.username).first()
-
-    #favorite = Favorite()
-    #favorite.user_id = user.id
-
-    #db.session.add(favorite)
-    #db.session.commit()
-
-    response_body = {
-        "msg": "The user was successfully created."
+from werkzeug.middleware.proxy_fix import ProxyFix
+import passwords
+import encoding
+from api import api, jwt, catalog_key
+from cache import create_cache, on_commit
+from importer import import_swapi_command
+from maintenance import rebuild_favorites_command
+from identity import IdentityCache
+from metrics import setup_metrics
+from routing import setup_replica_routing
+from ratelimit import setup_rate_limits
+from search import SearchIndex
+from compression import setup_compression
+from sqlalchemy import select
+from models import db, User, Favorite, FavoriteSummary, Character, Planet, CacheVersion
+
+
+def create_app(config=None):
+    """Builds the app from the environment, `config` overrides any of the settings."""
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DB_CONNECTION_STRING')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # connection pool, only the settings present in the environment are passed to the engine
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1'}
+    for option, variable in (('pool_size', 'DB_POOL_SIZE'), ('max_overflow', 'DB_MAX_OVERFLOW'),
+                             ('pool_recycle', 'DB_POOL_RECYCLE'), ('pool_timeout', 'DB_POOL_TIMEOUT')):
+        if os.environ.get(variable):
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'][option] = int(os.environ[variable])
+    if os.environ.get('DB_REPLICA_CONNECTION_STRING'):
+        app.config['SQLALCHEMY_BINDS'] = {'replica': os.environ['DB_REPLICA_CONNECTION_STRING']}
+    app.config['REPLICA_STICKY_SECONDS'] = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+    app.config['REPLICA_ENDPOINTS'] = ('api.get_character', 'api.get_planet', 'api.get_characters', 'api.get_planets', 'api.get_favorites')
+    app.config["JWT_SECRET_KEY"] = "super-secret"  # Change this!
+    app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', 300))
+    app.config['CACHE_MAX_ENTRIES'] = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+    app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL')
+    # how often an in-process cache checks whether another worker changed a character or planet
+    app.config['CACHE_CHECK_SECONDS'] = float(os.environ.get('CACHE_CHECK_SECONDS', 2))
+    app.config['CACHE_CONTROL'] = {
+        'api.get_character': os.environ.get('CACHE_CONTROL_CHARACTER', 'public, max-age=60'),
+        'api.get_planet': os.environ.get('CACHE_CONTROL_PLANET', 'public, max-age=60'),
+        'api.get_favorites': os.environ.get('CACHE_CONTROL_FAVORITES', 'private, no-cache'),
     }
-
-    return jsonify(response_body), 200
-
-
-@app.route("/login", methods=["POST"])
-def login():
-    username = request.json.get("username", None)
-    password = request.json.get("password", None)
-    error_messages=[]
-    
-    if username is None:
-        error_messages.append({"msg": "Username is required"})
-    if password is None:
-        error_messages.append({"msg": "Password is required"})
-    if len(error_messages) > 0:
-        return jsonify(error_messages), 400
-
-    user = User.query.filter_by(username=username).one_or_none()
-
-    if not user:
-        return jsonify({"msg": "Username doesn't exist"}), 400
-    if not user.check_password(password):
-        return jsonify({"msg": "Invalid password"}), 401
-    
-    expiration = timedelta(days=1)
-    access_token = create_access_token(identity=user, expires_delta=expiration)
-    return jsonify('The login has been successful.', {'token':access_token}), 200
-
-
-# Protect a route with jwt_required, which will kick out requests
-# without a valid JWT present.
-@app.route("/favorites", methods=["GET"])
-@jwt_required()
-def get_favorites():
-
-    favorite = Favorite.query.filter_by(user_id=current_user.id)
-    all_favorites = list(map(lambda favorite: favorite.serialize(), favorite))
-    return jsonify(all_favorites), 200
-
-
-@app.route("/favorites", methods=["POST"])
-@jwt_required()
-def add_favorite():
-
-    #favorites_db = Favorite.query.filter_by(user_id=current_user.id)
-    #favorites_db = list(map(lambda favorite: favorite.serialize(), favorites_db))
-    #favorite_list = []
-
-    #for i in favorites_db:
-    #    favorite_list.append(i['character_id'])
-
-    newCharacter = request.json.get('character_id', None)
-    newPlanet = request.json.get('planet_id', None)
-
-    if newCharacter >= 0:
-        newFavorite = Favorite(user_id=current_user.id, character_id = newCharacter)
-        db.session.add(newFavorite)
-        db.session.commit()
-    if newPlanet:
-        newFavorite = Favorite(user_id=current_user.id, planet_id = newPlanet)
-        db.session.add(newFavorite)
-        db.session.commit()
-
-    print(False)
-    return jsonify(True),200
-
-    #newFavorite = Favorite(user_id=current_user.id, character_id = favorite['character_id'])
-
-    #favorite_list.append(newFavorite.character_id)
-
-    #db.session.add(favorite_list)
-    #db.session.commit()
-
-    #return jsonify(newFavorite.serialize()), 200
-
-
-@app.route("/character/<int:id>", methods=["GET"])
-def get_character(id):
-
-    character = Character.query.filter_by(id=id).all()
-    character = list(map(lambda x: x.serialize(), character))
-
-    return jsonify(character), 200
-
-
-@app.route("/planet/<int:id>", methods=["GET"])
-def get_planet(id):
-
-    planet = Planet.query.filter_by(id=id).all()
-    planet = list(map(lambda x: x.serialize(), planet))
-
-    return jsonify(planet), 200
+    app.config['PASSWORD_HASH_ITERATIONS'] = int(os.environ.get('PASSWORD_HASH_ITERATIONS', passwords.DEFAULT_ITERATIONS))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', passwords.default_workers()))
+    app.config['JWT_IDENTITY_CACHE_TTL'] = int(os.environ.get('JWT_IDENTITY_CACHE_TTL', 30))
+    app.config['JWT_IDENTITY_CACHE_SIZE'] = int(os.environ.get('JWT_IDENTITY_CACHE_SIZE', 10000))
+    # put is_active in the token so authenticated requests skip the user lookup,
+    # a deactivated user then keeps access until the token expires
+    app.config['JWT_EMBED_USER_CLAIMS'] = os.environ.get('JWT_EMBED_USER_CLAIMS') == '1'
+    app.config['MAX_BULK_FAVORITES'] = int(os.environ.get('MAX_BULK_FAVORITES', 1000))
+    app.config['SLOW_REQUEST_MS'] = int(os.environ.get('SLOW_REQUEST_MS', 0))
+    app.config['JSON_ENCODER_NAME'] = os.environ.get('JSON_ENCODER_NAME', 'auto')
+    # encode every character and planet into the cache when a worker starts
+    app.config['CATALOG_PRELOAD'] = os.environ.get('CATALOG_PRELOAD') == '1'
+    app.config['SEARCH_MAX_RESULTS'] = int(os.environ.get('SEARCH_MAX_RESULTS', 20))
+    # how often the search index looks for rows added or deleted by other workers, and fully rebuilds
+    app.config['SEARCH_CHECK_SECONDS'] = int(os.environ.get('SEARCH_CHECK_SECONDS', 5))
+    app.config['SEARCH_REBUILD_SECONDS'] = int(os.environ.get('SEARCH_REBUILD_SECONDS', 60))
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+    # favorites lists with more rows than this are streamed instead of built in memory
+    # when the user has no summary (and get no ETag)
+    app.config['STREAM_THRESHOLD'] = int(os.environ.get('STREAM_THRESHOLD', 1000))
+    app.config['PAGE_SIZE'] = int(os.environ.get('PAGE_SIZE', 50))
+    app.config['MAX_PAGE_SIZE'] = int(os.environ.get('MAX_PAGE_SIZE', 500))
+    # "<requests>/<seconds>" for /login and /signup, counted per client IP and per username
+    app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+    app.config['RATE_LIMIT_PER_IP'] = os.environ.get('RATE_LIMIT_PER_IP', '20/60')
+    app.config['RATE_LIMIT_PER_USERNAME'] = os.environ.get('RATE_LIMIT_PER_USERNAME', '5/60')
+    app.config['RATE_LIMIT_REDIS_URL'] = os.environ.get('RATE_LIMIT_REDIS_URL')
+    # proxies in front of the app whose X-Forwarded-For/-Proto are trusted (1 on heroku), 0 trusts none
+    app.config['TRUSTED_PROXY_HOPS'] = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+    # API-only workers can leave out Flask-Admin and Flask-Migrate, only the `flask db` commands need the latter
+    app.config['ADMIN_ENABLED'] = os.environ.get('ADMIN_ENABLED', '1') == '1'
+    app.config['MIGRATE_ENABLED'] = os.environ.get('MIGRATE_ENABLED', '1') == '1'
+    # swapi.dev client used by `flask import-swapi`, pages are revalidated against the cache folder
+    app.config['UPSTREAM_CONNECT_TIMEOUT'] = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 3.05))
+    app.config['UPSTREAM_READ_TIMEOUT'] = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 10))
+    app.config['UPSTREAM_RETRIES'] = int(os.environ.get('UPSTREAM_RETRIES', 3))
+    app.config['UPSTREAM_CACHE_DIR'] = os.environ.get('UPSTREAM_CACHE_DIR', '.cache/upstream') or None
+    app.config['ADMIN_PAGE_SIZE'] = int(os.environ.get('ADMIN_PAGE_SIZE', 50))
+    # seconds an admin list count is reused before it runs again
+    app.config['ADMIN_COUNT_TTL'] = int(os.environ.get('ADMIN_COUNT_TTL', 60))
+    app.config.update(config or {})
+
+    if app.config['TRUSTED_PROXY_HOPS']:
+        # remote_addr becomes the client's address instead of the router's
+        hops = app.config['TRUSTED_PROXY_HOPS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+    db.init_app(app)
+    jwt.init_app(app)
+    CORS(app)
+    # imported here so workers that don't use them never load flask_admin or alembic
+    if app.config['ADMIN_ENABLED']:
+        from admin import setup_admin
+        setup_admin(app)
+    if app.config['MIGRATE_ENABLED']:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    app.cli.add_command(import_swapi_command)
+    app.cli.add_command(rebuild_favorites_command)
+    # fails at startup on an encoder that isn't installed, requests use it through current_app
+    encoding.encoder(app.config['JSON_ENCODER_NAME'])
+
+    # serialized JSON of the characters and planets, keyed by "<table>:<id>". Each
+    # entry is "<etag>\n<body>" so a hit needs no hashing or encoding.
+    # Kept in memory, edits made in other workers reach it through the cache_version table.
+    catalog_cache = app.extensions['catalog_cache'] = create_cache(
+        app.config,
+        read_version=lambda: CacheVersion.current(db.get_engine(app), 'catalog'),
+        bump_version=lambda: CacheVersion.bump(db.get_engine(app), 'catalog'))
+    identity_cache = app.extensions['identity_cache'] = IdentityCache(app.config['JWT_IDENTITY_CACHE_SIZE'], app.config['JWT_IDENTITY_CACHE_TTL'])
+    search_index = app.extensions['search_index'] = SearchIndex(app.config['SEARCH_CHECK_SECONDS'], app.config['SEARCH_REBUILD_SECONDS'])
+
+    def invalidate_catalog(model, values, deleted):
+        catalog_cache.delete(catalog_key(model, values['id']))
+
+    on_commit(app, Character, invalidate_catalog)
+    on_commit(app, Planet, invalidate_catalog)
+    on_commit(app, Character, search_index.update)
+    on_commit(app, Planet, search_index.update)
+    on_commit(app, User, lambda model, values, deleted: identity_cache.invalidate(values['id']))
+    # favorites saved in the admin and renamed characters or planets drop the summaries
+    # they affect, the next read or favorites change builds them again
+    on_commit(app, Favorite, lambda model, values, deleted: FavoriteSummary.invalidate([values['user_id']]))
+    on_commit(app, Character, lambda model, values, deleted: FavoriteSummary.invalidate(
+        select(Favorite.user_id).where(Favorite.character_id == values['id'])))
+    on_commit(app, Planet, lambda model, values, deleted: FavoriteSummary.invalidate(
+        select(Favorite.user_id).where(Favorite.planet_id == values['id'])))
+
+    app.register_blueprint(api)
+    setup_rate_limits(app)
+    setup_compression(app)
+    setup_replica_routing(app)
+    setup_metrics(app, caches={'catalog': catalog_cache, 'identity': identity_cache})
+    return app
 
 # this only runs if `$ python src/main.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
-    app.run(host='0.0.0.0', port=PORT, debug=False)
+    create_app().run(host='0.0.0.0', port=PORT, debug=False)
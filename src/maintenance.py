@@ -0,0 +1,58 @@
+"""
+Repairs for the data derived from other tables.
+
+$ flask rebuild-favorites            (every user)
+$ flask rebuild-favorites --missing  (only users without a summary, run on release)
+$ flask rebuild-favorites --user-id 12 --user-id 40
+"""
+import itertools
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select, true
+from models import db, Favorite, FavoriteSummary, Character, Planet, insert_ignore
+
+BATCH_SIZE = 500
+
+
+def rebuild_favorite_summaries(user_ids=None, missing=False):
+    """Rebuilds the favorite summaries from the favorite table and returns how many were
+    written. Users are done BATCH_SIZE at a time, two queries and a commit per batch."""
+    selected = Favorite.user_id.in_(user_ids) if user_ids else true()
+    if missing:
+        selected = db.and_(selected, Favorite.user_id.notin_(select(FavoriteSummary.user_id)))
+    else:
+        # users left without favorites get an empty summary on their next read
+        db.session.execute(FavoriteSummary.__table__.delete().where(
+            FavoriteSummary.user_id.in_(user_ids) if user_ids else true()))
+        db.session.commit()
+
+    favorites = select(
+        Favorite.user_id, Favorite.character_id, Favorite.planet_id, Character.name, Planet.name
+    ).outerjoin(Character, Favorite.character_id == Character.id).outerjoin(
+        Planet, Favorite.planet_id == Planet.id
+    ).order_by(Favorite.user_id, Favorite.id)
+
+    written = 0
+    last_user_id = 0
+    while True:
+        batch_ids = db.session.execute(select(Favorite.user_id).distinct().where(
+            selected, Favorite.user_id > last_user_id).order_by(Favorite.user_id).limit(BATCH_SIZE)).scalars().all()
+        if not batch_ids:
+            return written
+        rows = db.session.execute(favorites.where(Favorite.user_id.in_(batch_ids)))
+        batch = [FavoriteSummary.values(user_id, Favorite.serialize_rows(row[1:] for row in user_rows))
+                 for user_id, user_rows in itertools.groupby(rows, key=lambda row: row[0])]
+        # a summary built by a request in the meantime is just as current, it's kept
+        db.session.execute(insert_ignore(FavoriteSummary), batch)
+        db.session.commit()
+        written += len(batch)
+        last_user_id = batch_ids[-1]
+
+
+@click.command('rebuild-favorites')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Only rebuild these users.')
+@click.option('--missing', is_flag=True, help='Only build the summaries that are missing.')
+@with_appcontext
+def rebuild_favorites_command(user_ids, missing):
+    written = rebuild_favorite_summaries(list(user_ids), missing)
+    click.echo('%d favorite summaries written' % written)
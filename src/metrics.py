@@ -0,0 +1,131 @@
+import time
+import logging
+import threading
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the request latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# statements kept per request for the slow request log
+MAX_LOGGED_STATEMENTS = 50
+
+
+class Metrics:
+    """Per-endpoint request counters and latency histograms, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, method, status, seconds, sql_count, sql_seconds):
+        with self._lock:
+            entry = self.endpoints.get((endpoint, method))
+            if entry is None:
+                entry = self.endpoints[(endpoint, method)] = {
+                    "buckets": [0] * len(BUCKETS),
+                    "count": 0,
+                    "sum": 0.0,
+                    "sql_count": 0,
+                    "sql_seconds": 0.0,
+                    "statuses": {},
+                }
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry["buckets"][i] += 1
+            entry["count"] += 1
+            entry["sum"] += seconds
+            entry["sql_count"] += sql_count
+            entry["sql_seconds"] += sql_seconds
+            entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+
+    def render(self, caches=None):
+        # samples of a metric have to be listed together, right after its TYPE line
+        families = {
+            "http_request_duration_seconds": ("histogram", []),
+            "http_requests_total": ("counter", []),
+            "db_statements_total": ("counter", []),
+            "db_duration_seconds_total": ("counter", []),
+            "cache_hits_total": ("counter", []),
+            "cache_misses_total": ("counter", []),
+            "cache_evictions_total": ("counter", []),
+        }
+        with self._lock:
+            for (endpoint, method), entry in sorted(self.endpoints.items()):
+                labels = 'endpoint="%s",method="%s"' % (endpoint, method)
+                samples = families["http_request_duration_seconds"][1]
+                for bound, count in zip(BUCKETS, entry["buckets"]):
+                    samples.append('http_request_duration_seconds_bucket{%s,le="%s"} %d' % (labels, bound, count))
+                samples.append('http_request_duration_seconds_bucket{%s,le="+Inf"} %d' % (labels, entry["count"]))
+                samples.append('http_request_duration_seconds_sum{%s} %f' % (labels, entry["sum"]))
+                samples.append('http_request_duration_seconds_count{%s} %d' % (labels, entry["count"]))
+                for status, count in sorted(entry["statuses"].items()):
+                    families["http_requests_total"][1].append('http_requests_total{%s,status="%s"} %d' % (labels, status, count))
+                families["db_statements_total"][1].append('db_statements_total{%s} %d' % (labels, entry["sql_count"]))
+                families["db_duration_seconds_total"][1].append('db_duration_seconds_total{%s} %f' % (labels, entry["sql_seconds"]))
+        for name, cache in sorted((caches or {}).items()):
+            stats = cache.stats()
+            for counter in ("hits", "misses", "evictions"):
+                family = "cache_%s_total" % counter
+                families[family][1].append('%s{cache="%s"} %d' % (family, name, stats[counter]))
+
+        lines = []
+        for family, (kind, samples) in families.items():
+            lines.append("# TYPE %s %s" % (family, kind))
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+# SQL timing for every engine, attributed to the request being served if there is one
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_seconds += elapsed
+        if len(g.sql_statements) < MAX_LOGGED_STATEMENTS:
+            g.sql_statements.append((elapsed, statement))
+
+
+def setup_metrics(app, caches=None):
+    """Times every request, adds a Server-Timing header and serves everything at /metrics.
+
+    Requests slower than app.config['SLOW_REQUEST_MS'] are logged with their SQL, 0 turns it off.
+    """
+    metrics = Metrics()
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+        g.sql_statements = []
+
+    @app.after_request
+    def record_request(response):
+        if 'request_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_started
+        endpoint = request.endpoint or 'unmatched'
+        metrics.observe(endpoint, request.method, response.status_code, elapsed, g.sql_count, g.sql_seconds)
+        response.headers.add('Server-Timing', 'app;dur=%.1f, db;dur=%.1f;desc="%d queries"' % (
+            elapsed * 1000, g.sql_seconds * 1000, g.sql_count))
+
+        slow_ms = app.config.get('SLOW_REQUEST_MS', 0)
+        if slow_ms and elapsed * 1000 >= slow_ms:
+            logger.warning('Slow request %s %s took %.1fms (%d queries, %.1fms in the db)\n%s',
+                           request.method, request.path, elapsed * 1000, g.sql_count, g.sql_seconds * 1000,
+                           "\n".join('  %.1fms %s' % (seconds * 1000, statement) for seconds, statement in g.sql_statements))
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        return metrics.render(caches), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+    return metrics
@@ -1,14 +1,39 @@
-from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import safe_str_cmp
+import json
+import hashlib
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, mysql
+import encoding
+from passwords import hash_password, verify_password, needs_rehash
+from routing import RoutingSQLAlchemy
 
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+
+def insert_ignore(model):
+    """INSERT that skips rows breaking a unique constraint instead of failing."""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model.__table__).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return model.__table__.insert().prefix_with('OR IGNORE')
+    if dialect == 'mysql':
+        return model.__table__.insert().prefix_with('IGNORE')
+    return model.__table__.insert()
+
+def project(model, names):
+    """Query returning plain (name, ...) tuples of the given columns, no ORM objects
+    are built. For Character and Planet the column names are the serialize() keys."""
+    return db.session.query(*[getattr(model, name) for name in names])
+
+def column_names(model):
+    return [column.key for column in model.__table__.columns]
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(100), unique=True, nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
-    password = db.Column(db.String(100), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
     is_active = db.Column(db.Boolean(), unique=False, nullable=True)
     users = db.relationship('Favorite', backref='user', lazy=True)
 
@@ -22,14 +47,20 @@ class User(db.Model):
             "email": self.email,
         }
 
+    def set_password(self, password):
+        self.password = hash_password(password)
+
     def check_password(self, password):
-        return safe_str_cmp(password, self.password)
+        return verify_password(password, self.password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password)
 
 class Character(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     birth_day = db.Column(db.String(100), nullable=False)
-    gender = db.Column(db.String(100), nullable=False)
+    gender = db.Column(db.String(100), nullable=False, index=True)
     height = db.Column(db.Integer, nullable=False)
     skin_color = db.Column(db.String(100), nullable=False)
     hair_color = db.Column(db.String(100), nullable=False)
@@ -53,10 +84,10 @@ class Character(db.Model):
 
 class Planet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    climate = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
+    climate = db.Column(db.String(100), nullable=False, index=True)
     population = db.Column(db.String(100), nullable=False)
-    terrain = db.Column(db.String(100), nullable=False)
+    terrain = db.Column(db.String(100), nullable=False, index=True)
     rotation_period = db.Column(db.Integer, nullable=False)
     orbital_period = db.Column(db.Integer, nullable=False)
     diameter = db.Column(db.Integer, nullable=False)
@@ -83,26 +114,182 @@ class Favorite(db.Model):
     character_id = db.Column(db.Integer, db.ForeignKey('character.id'))
     planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'))
 
+    # user_id leads both indexes so they also serve filter_by(user_id=...), and being
+    # unique they stop a user from saving the same favorite twice. NULLs never collide in
+    # a unique index, so planet rows don't conflict on character_id and the other way round.
+    __table_args__ = (
+        db.Index('ix_favorite_user_character', user_id, character_id, unique=True),
+        db.Index('ix_favorite_user_planet', user_id, planet_id, unique=True),
+    )
+
     def __repr__(self):
         return '<Favorite %r>' % self.user_id
 
     def serialize(self):
-        character = Character.query.filter_by(id=self.character_id).first()
-        planet = Planet.query.filter_by(id=self.planet_id).first()
-        if character and planet:
+        return Favorite.serialize_row((
+            self.character_id,
+            self.planet_id,
+            self.character.name if self.character else None,
+            self.planet.name if self.planet else None,
+        ))
+
+    @classmethod
+    def rows_for_user_statement(cls, user_id):
+        # One JOIN for the whole list instead of a Character and a Planet
+        # lookup per favorite. A plain statement so asgi.py can run it async.
+        return select(
+            cls.character_id, cls.planet_id, Character.name, Planet.name
+        ).outerjoin(Character, cls.character_id == Character.id).outerjoin(
+            Planet, cls.planet_id == Planet.id
+        ).where(cls.user_id == user_id).order_by(cls.id)
+
+    @classmethod
+    def rows_for_user(cls, user_id):
+        # server side cursor where the driver supports it, rows are fetched as they are read
+        return db.session.execute(cls.rows_for_user_statement(user_id), execution_options={"stream_results": True})
+
+    @staticmethod
+    def serialize_row(row):
+        character_id, planet_id, character_name, planet_name = row
+        if character_name is not None and planet_name is not None:
             return {
-                "character_id": self.character_id,
-                "planet_id": self.planet_id,
-                "characters": character.name,
-                "planets": planet.name,
+                "character_id": character_id,
+                "planet_id": planet_id,
+                "characters": character_name,
+                "planets": planet_name,
             }
-        if character:
+        if character_name is not None:
             return {
-                "character_id": self.character_id,
-                "characters": character.name,
+                "character_id": character_id,
+                "characters": character_name,
             }
-        if planet:
+        if planet_name is not None:
             return {
-                "planet_id": self.planet_id,
-                "planets": planet.name,
-            }
\ No newline at end of file
+                "planet_id": planet_id,
+                "planets": planet_name,
+            }
+
+    @staticmethod
+    def serialize_rows(rows):
+        return [Favorite.serialize_row(row) for row in rows]
+
+
+class FavoriteSummary(db.Model):
+    """The GET /favorites body of each user, so reading it is one primary key lookup
+    whatever the number of favorites. Adding or removing favorites edits the stored
+    list in the same transaction, only the new favorites' names are looked up. A
+    missing row is built again from the favorite table (see `flask rebuild-favorites`)."""
+    __tablename__ = 'favorite_summary'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    # BLOB tops out at 64KB on MySQL
+    body = db.Column(db.LargeBinary().with_variant(mysql.LONGBLOB(), 'mysql'), nullable=False)
+    etag = db.Column(db.String(40), nullable=False)
+
+    def __repr__(self):
+        return '<FavoriteSummary %r>' % self.user_id
+
+    @staticmethod
+    def values(user_id, items):
+        body = encoding.encode(items)
+        return {"user_id": user_id, "body": body, "etag": hashlib.sha1(body).hexdigest()}
+
+    @classmethod
+    def build(cls, user_id):
+        return cls.values(user_id, Favorite.serialize_rows(Favorite.rows_for_user(user_id)))
+
+    @classmethod
+    def stored(cls, user_id):
+        """Returns the user's stored (body, etag), None when the summary is missing."""
+        return db.session.query(cls.body, cls.etag).filter_by(user_id=user_id).one_or_none()
+
+    @classmethod
+    def store(cls, values):
+        # a summary written by a concurrent request in the meantime is just as current, it's kept
+        db.session.execute(insert_ignore(cls), values)
+        db.session.commit()
+
+    @classmethod
+    def update(cls, user_id, added=(), removed=()):
+        """Applies added and removed (character_id, planet_id) pairs to the user's summary,
+        in the caller's transaction. Pairs already added or removed are skipped, so the
+        request that lost a race for the same favorite leaves the summary right too.
+
+        Reads stay constant because writes pay for them: every change decodes and
+        re-encodes the user's whole list, O(favorites) in CPU and in the size of the row
+        written, even when a single favorite is added. No joins or per-favorite queries
+        run, only the names of the added favorites are looked up. A list holding a
+        favorite whose character or planet doesn't exist is built again instead."""
+        summary = db.session.query(cls).filter_by(user_id=user_id).with_for_update().one_or_none()
+        if summary is None:
+            # built from the favorite table it already includes this transaction's changes
+            if db.session.execute(insert_ignore(cls), cls.build(user_id)).rowcount:
+                return
+            summary = db.session.query(cls).filter_by(user_id=user_id).with_for_update().one()
+
+        items = json.loads(summary.body)
+        if None in items:
+            # such a favorite is serialized as null, without the ids to match it against
+            values = cls.build(user_id)
+            summary.body = values['body']
+            summary.etag = values['etag']
+            return
+
+        removed = set(removed)
+        items = [item for item in items if cls.item_key(item) not in removed]
+        present = set(cls.item_key(item) for item in items)
+        added = [pair for pair in added if pair not in present]
+        character_names = cls.names(Character, [character_id for character_id, _ in added if character_id is not None])
+        planet_names = cls.names(Planet, [planet_id for _, planet_id in added if planet_id is not None])
+        for character_id, planet_id in added:
+            items.append(Favorite.serialize_row((character_id, planet_id, character_names.get(character_id), planet_names.get(planet_id))))
+
+        values = cls.values(user_id, items)
+        summary.body = values['body']
+        summary.etag = values['etag']
+
+    @staticmethod
+    def names(model, ids):
+        if not ids:
+            return {}
+        return dict(db.session.query(model.id, model.name).filter(model.id.in_(ids)))
+
+    @staticmethod
+    def item_key(item):
+        return (item.get('character_id'), item.get('planet_id'))
+
+    @classmethod
+    def invalidate(cls, user_ids):
+        """Deletes the summaries of `user_ids` (a list or a select), on a connection of
+        its own so it can run from an on_commit callback."""
+        with db.engine.begin() as connection:
+            connection.execute(cls.__table__.delete().where(cls.user_id.in_(user_ids)))
+
+
+class CacheVersion(db.Model):
+    """A counter per cache that every process can read, bumped when some of its entries
+    went stale. Processes keeping the cache in memory compare it with the value they
+    last saw to learn about the writes made by the others (see cache.VersionedCache)."""
+    __tablename__ = 'cache_version'
+    name = db.Column(db.String(40), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return '<CacheVersion %r>' % self.name
+
+    @classmethod
+    def current(cls, engine, name):
+        # on a connection of its own, it's read outside the app context by asgi.py
+        with engine.connect() as connection:
+            return connection.execute(select(cls.version).where(cls.name == name)).scalar() or 0
+
+    @classmethod
+    def bump(cls, engine, name):
+        with engine.begin() as connection:
+            if connection.execute(cls.__table__.update().where(cls.name == name).values(version=cls.version + 1)).rowcount:
+                return
+            try:
+                with connection.begin_nested():
+                    connection.execute(cls.__table__.insert(), {"name": name, "version": 1})
+            except IntegrityError:
+                # another process inserted it in the meantime
+                connection.execute(cls.__table__.update().where(cls.name == name).values(version=cls.version + 1))
@@ -0,0 +1,89 @@
+"""
+Password hashing with PBKDF2-SHA256 (hashlib, no extra packages).
+
+The key derivation runs in a process pool of PASSWORD_HASH_WORKERS processes.
+The request thread waits for its hash, so this only frees the web worker when it
+has other threads to serve requests meanwhile: the Procfile runs gunicorn with
+gthread workers for that. Every gunicorn process gets its own pool, the default
+size splits the host's cores between the WEB_CONCURRENCY processes, so at most one
+hash per core runs at a time and a burst of logins queues instead of starving the
+other requests.
+
+Stored hashes look like "pbkdf2_sha256$<iterations>$<salt>$<hash>", which lets
+the iterations change at any time: old hashes keep working and are upgraded on
+the next successful login (see needs_rehash).
+"""
+import os
+import hmac
+import base64
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, has_app_context
+
+ALGORITHM = 'pbkdf2_sha256'
+DEFAULT_ITERATIONS = 260000
+
+
+def default_workers():
+    """The host's cores divided between the gunicorn processes (WEB_CONCURRENCY)."""
+    return max(1, (os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY') or 1))
+
+
+# used outside an app (scripts, benchmarks), requests read PASSWORD_HASH_* from the app config
+_defaults = {'iterations': DEFAULT_ITERATIONS, 'workers': default_workers()}
+_pools = {}
+
+
+def configure(iterations=None, workers=None):
+    """Settings for hashing outside an app context. workers=0 hashes in the calling thread."""
+    if iterations is not None:
+        _defaults['iterations'] = iterations
+    if workers is not None:
+        _defaults['workers'] = workers
+
+def _setting(name):
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_' + name.upper(), _defaults[name])
+    return _defaults[name]
+
+def _run(function, *args):
+    workers = _setting('workers')
+    if workers == 0:
+        return function(*args)
+    # created on first use so every gunicorn worker gets its own pool after the fork
+    pool = _pools.get(workers)
+    if pool is None:
+        pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+    return pool.submit(function, *args).result()
+
+def _derive(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def is_hashed(stored):
+    return stored is not None and stored.startswith(ALGORITHM + '$')
+
+def hash_password(password, iterations=None):
+    iterations = iterations or _setting('iterations')
+    salt = os.urandom(16)
+    derived = _run(_derive, password, salt, iterations)
+    return '%s$%d$%s$%s' % (ALGORITHM, iterations, _b64(salt), _b64(derived))
+
+def verify_password(password, stored):
+    if not is_hashed(stored):
+        # rows created before hashing was added still hold the plain password
+        return stored is not None and hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    _, iterations, salt, expected = stored.split('$')
+    derived = _run(_derive, password, _unb64(salt), int(iterations))
+    return hmac.compare_digest(derived, _unb64(expected))
+
+def needs_rehash(stored):
+    if not is_hashed(stored):
+        return True
+    return int(stored.split('$')[1]) != _setting('iterations')
@@ -0,0 +1,119 @@
+"""
+Token bucket rate limiting for the endpoints that are cheap to call and expensive to serve.
+
+A bucket holds up to `capacity` tokens and refills at `capacity / period` tokens per
+second, every request takes one. Buckets live in a store: MemoryBucketStore for a
+single process, RedisBucketStore to share them between workers. Any object with the
+same take() method can be used as a store, e.g. a fake in tests.
+"""
+import math
+import time
+import threading
+from functools import wraps
+from collections import OrderedDict
+from flask import current_app, jsonify, request
+
+
+class MemoryBucketStore:
+    def __init__(self, max_buckets=100000):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, period):
+        """Takes a token, returns 0 if there was one or the seconds until the next one."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * capacity / period)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) * period / capacity
+            self._buckets[key] = (tokens, now)
+            # the least recently used buckets go first, they have refilled by then anyway
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+
+class RedisBucketStore:
+    """Buckets kept in redis and updated atomically by a Lua script."""
+
+    SCRIPT = """
+    local capacity, period, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated_at) * capacity / period)
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        retry_after = (1 - tokens) * period / capacity
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(period))
+    return tostring(retry_after)
+    """
+
+    def __init__(self, client, prefix='ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self.script = client.register_script(self.SCRIPT)
+
+    def take(self, key, capacity, period):
+        return float(self.script(keys=[self.prefix + key], args=[capacity, period, time.time()]))
+
+
+def create_bucket_store(config):
+    redis_url = config.get('RATE_LIMIT_REDIS_URL')
+    if redis_url:
+        import redis
+        return RedisBucketStore(redis.Redis.from_url(redis_url))
+    return MemoryBucketStore()
+
+def parse_rate(rate):
+    """"10/60" means 10 requests every 60 seconds."""
+    capacity, period = rate.split('/')
+    return int(capacity), float(period)
+
+
+def rate_limited(*limits):
+    """Decorator for a view, `limits` are (config key, key function) pairs. The request
+    is answered with a 429 before the view runs if any of its buckets is empty. Limits are
+    checked in order and the first empty bucket stops there, so a client turned away by its
+    IP bucket doesn't also drain the username bucket. A key function returning None skips
+    that limit."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            store = current_app.extensions.get('rate_limit_store')
+            if store is None:
+                return view(*args, **kwargs)
+            for config_key, key_function in limits:
+                key = key_function()
+                if key is None:
+                    continue
+                capacity, period = parse_rate(current_app.config[config_key])
+                retry_after = store.take(view.__name__ + ':' + key, capacity, period)
+                if retry_after > 0:
+                    return jsonify({"msg": "Too many requests, try again later"}), 429, {'Retry-After': str(math.ceil(retry_after))}
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def setup_rate_limits(app):
+    if app.config['RATE_LIMIT_ENABLED']:
+        app.extensions['rate_limit_store'] = create_bucket_store(app.config)
+
+def client_ip():
+    # behind a proxy this is the client's address only once ProxyFix is set up, see TRUSTED_PROXY_HOPS
+    return 'ip:' + (request.remote_addr or 'unknown')
+
+def json_username():
+    request_body = request.get_json(silent=True)
+    if isinstance(request_body, dict) and isinstance(request_body.get('username'), str):
+        return 'username:' + request_body['username'].lower()
+    return None
@@ -0,0 +1,80 @@
+"""
+Read replica routing: when SQLALCHEMY_BINDS has a "replica" entry, the read-only
+endpoints listed in REPLICA_ENDPOINTS run their queries on it, everything else,
+and any flush, uses the primary database.
+
+Replicas lag a little behind, so a client that just wrote something keeps reading
+from the primary for REPLICA_STICKY_SECONDS. The client is recognized by a cookie
+(works across workers) or by the user id of its token (this worker only, for API
+clients that don't keep cookies). Keying on the user rather than on the token keeps
+a new token from /login, or a second device, on the primary too.
+"""
+import time
+import jwt
+from flask import g, request, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from cache import LRUCache
+
+STICKY_COOKIE = 'read_primary_until'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if has_request_context() and g.get('use_replica') and not self._flushing:
+            return self.db.get_engine(self.app, bind='replica')
+        return super().get_bind(mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def mark_writer(user_id):
+    """For writes that don't carry the user's token, /signup and /login."""
+    g.writer_id = user_id
+
+def token_user_id():
+    """The "sub" of the bearer token. The signature isn't checked, the id only picks a
+    database, and a write only counts once the view has accepted the token."""
+    authorization = request.headers.get('Authorization', '')
+    if not authorization.startswith('Bearer '):
+        return None
+    try:
+        return jwt.decode(authorization[len('Bearer '):], options={'verify_signature': False}).get('sub')
+    except jwt.InvalidTokenError:
+        return None
+
+def wrote_recently(recent_writers):
+    if request.cookies.get(STICKY_COOKIE, type=float, default=0) > time.time():
+        return True
+    user_id = token_user_id()
+    return user_id is not None and recent_writers.get(str(user_id)) is not None
+
+def setup_replica_routing(app):
+    if 'replica' not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+        return
+    sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+    recent_writers = LRUCache(max_entries=10000, ttl=sticky_seconds)
+
+    @app.before_request
+    def choose_database():
+        g.use_replica = (
+            request.method in ('GET', 'HEAD')
+            and request.endpoint in app.config['REPLICA_ENDPOINTS']
+            and not wrote_recently(recent_writers)
+        )
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method in WRITE_METHODS and response.status_code < 400:
+            user_id = g.writer_id if 'writer_id' in g else token_user_id()
+            if user_id is not None:
+                recent_writers.set(str(user_id), True)
+            response.set_cookie(STICKY_COOKIE, str(time.time() + sticky_seconds), max_age=sticky_seconds, httponly=True)
+        return response
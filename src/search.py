@@ -0,0 +1,204 @@
+import os
+import re
+import time
+import heapq
+import bisect
+import threading
+from flask import current_app
+from cache import LRUCache
+from models import db, Character, Planet
+
+# which columns are searchable and how much a match on each one counts
+SEARCH_FIELDS = {
+    Character: {'name': 3},
+    Planet: {'name': 3, 'terrain': 1, 'climate': 1},
+}
+TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN.findall((text or '').lower())
+
+
+class Postings:
+    """The data of one build of the index: documents, their tokens and the postings."""
+
+    def __init__(self):
+        self.documents = {}
+        self.document_tokens = {}
+        self.postings = {}
+        self.tokens = []
+
+    @classmethod
+    def load(cls):
+        postings = cls()
+        for model, fields in SEARCH_FIELDS.items():
+            names = ['id'] + list(fields)
+            query = db.session.query(*[getattr(model, name) for name in names])
+            for row in query.yield_per(1000):
+                postings.add(model, dict(zip(names, row)))
+        return postings
+
+    def add(self, model, values):
+        key = (model.__tablename__, values['id'])
+        self.remove(key)
+        self.documents[key] = (values['name'], values['name'].lower())
+        self.document_tokens[key] = set()
+        for field, weight in SEARCH_FIELDS[model].items():
+            for token in tokenize(values[field]):
+                self.document_tokens[key].add(token)
+                postings = self.postings.get(token)
+                if postings is None:
+                    postings = self.postings[token] = {}
+                    bisect.insort(self.tokens, token)
+                postings[key] = max(postings.get(key, 0), weight)
+
+    def remove(self, key):
+        if self.documents.pop(key, None) is None:
+            return
+        for token in self.document_tokens.pop(key):
+            del self.postings[token][key]
+            if not self.postings[token]:
+                del self.postings[token]
+                del self.tokens[bisect.bisect_left(self.tokens, token)]
+
+    def apply(self, model, values, deleted):
+        if deleted:
+            self.remove((model.__tablename__, values['id']))
+        else:
+            self.add(model, values)
+
+
+class SearchIndex:
+    """Inverted index of the character and planet names (plus planet terrain and climate).
+
+    Tokens are kept in a sorted list, so the tokens starting with a prefix are a
+    contiguous slice found with two binary searches. A query matches the documents
+    that have every one of its terms as a token prefix. Autocomplete sends the same
+    short prefixes over and over, so ranked results are memoized until the next write.
+
+    The first search builds the index, writes made in this process update it through
+    on_commit. Other workers and `flask import-swapi` (bulk inserts skip on_commit)
+    change the tables behind its back, so a background thread compares the row count
+    and highest id of each table with the ones the index was built from every
+    `check_seconds`, which catches added and deleted rows, and rebuilds it every
+    `rebuild_seconds` for the edits made elsewhere. A rebuild loads the new postings
+    without holding the lock and swaps them in, searches never wait for it.
+    """
+
+    def __init__(self, check_seconds=5, rebuild_seconds=60):
+        self.check_seconds = check_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.ready = False
+        self.fingerprint = None
+        self.built_at = 0
+        self.data = Postings()
+        self.results = LRUCache(max_entries=4096, ttl=3600)
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        # on_commit changes made while a rebuild loads, replayed on the new postings
+        self._pending = None
+        self._refresher_pid = None
+        self._closed = threading.Event()
+
+    def build(self):
+        """Builds the index the first time and starts the background refresh."""
+        if not self.ready:
+            with self._build_lock:
+                if not self.ready:
+                    self.rebuild()
+        # threads don't survive a fork, every gunicorn worker starts its own
+        if self._refresher_pid != os.getpid():
+            self._refresher_pid = os.getpid()
+            app = current_app._get_current_object()
+            threading.Thread(target=self._refresh_forever, args=(app,), daemon=True, name='search-index').start()
+
+    def rebuild(self):
+        fingerprint = self._fingerprint()
+        with self._lock:
+            self._pending = []
+        try:
+            data = Postings.load()
+        finally:
+            with self._lock:
+                pending, self._pending = self._pending, None
+        with self._lock:
+            for change in pending:
+                data.apply(*change)
+            self.data = data
+            self.results.clear()
+            self.fingerprint = fingerprint
+            self.built_at = time.monotonic()
+            self.ready = True
+
+    def refresh(self):
+        """Rebuilds when rows were added or deleted elsewhere, or after rebuild_seconds."""
+        if self._fingerprint() != self.fingerprint or time.monotonic() - self.built_at >= self.rebuild_seconds:
+            self.rebuild()
+
+    def close(self):
+        """Stops the background refresh."""
+        self._closed.set()
+
+    def _refresh_forever(self, app):
+        while not self._closed.wait(self.check_seconds):
+            with app.app_context():
+                try:
+                    self.refresh()
+                except Exception:
+                    app.logger.exception('search index refresh failed')
+                finally:
+                    db.session.remove()
+
+    def _fingerprint(self):
+        return tuple(tuple(db.session.query(db.func.count(model.id), db.func.max(model.id)).one())
+                     for model in SEARCH_FIELDS)
+
+    def update(self, model, values, deleted):
+        """on_commit callback keeping the index in step with the database."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((model, values, deleted))
+            if self.ready:
+                self.data.apply(model, values, deleted)
+                self.results.clear()
+
+    def search(self, query, limit):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        lowered = ' '.join(query.lower().split())
+        cache_key = '%d:%s' % (limit, lowered)
+        with self._lock:
+            results = self.results.get(cache_key)
+            if results is None:
+                results = self._search(terms, lowered, limit)
+                self.results.set(cache_key, results)
+            return results
+
+    def _search(self, terms, lowered, limit):
+        tokens, postings, documents = self.data.tokens, self.data.postings, self.data.documents
+        scores = None
+        for term in terms:
+            term_scores = {}
+            start = bisect.bisect_left(tokens, term)
+            end = bisect.bisect_left(tokens, term + '\uffff', start)
+            for token in tokens[start:end]:
+                # a whole word counts a bit more than a prefix of it
+                bonus = 1 if token == term else 0
+                for key, weight in postings[token].items():
+                    if weight + bonus > term_scores.get(key, 0):
+                        term_scores[key] = weight + bonus
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {key: score + term_scores[key] for key, score in scores.items() if key in term_scores}
+            if not scores:
+                return []
+
+        ranked = heapq.nsmallest(limit, (
+            # names starting with the query go first, then by score, shortest name
+            (-score - (5 if documents[key][1].startswith(lowered) else 0), len(documents[key][0]), documents[key][0], key)
+            for key, score in scores.items()
+        ))
+        return [{"type": kind, "id": id, "name": name} for _, _, name, (kind, id) in ranked]
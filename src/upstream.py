@@ -0,0 +1,100 @@
+"""
+HTTP client for the APIs the data is imported from (swapi.dev).
+
+One requests.Session per client, so connections are kept alive and pooled between
+the importer threads. Every request has a connect and a read timeout, and failed
+connections, 429s and 5xx answers are retried with exponential backoff (honouring
+Retry-After). With a cache folder, responses carrying an ETag or Last-Modified are
+saved there and sent back as If-None-Match/If-Modified-Since next time, so a repeated
+import gets 304s and reads the pages from disk.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ResponseCache:
+    """JSON bodies and their validators, one file per URL."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, url):
+        return os.path.join(self.folder, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+    def load(self, url):
+        try:
+            with open(self.path(url)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, url, etag, last_modified, body):
+        # written next to its final name and renamed, a crash never leaves half a file
+        fd, temporary = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"url": url, "etag": etag, "last_modified": last_modified, "body": body}, f)
+        os.replace(temporary, self.path(url))
+
+
+class UpstreamClient:
+    def __init__(self, base_url, timeout=(3.05, 10), retries=3, backoff=0.5, pool_size=10, cache_dir=None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.stats = {"requests": 0, "not_modified": 0}
+        self._lock = threading.Lock()
+
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset(['GET', 'HEAD']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get_json(self, path, params=None):
+        url = requests.Request('GET', self.base_url + path, params=params).prepare().url
+        cached = self.cache.load(url) if self.cache else None
+        headers = {}
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        self.count('requests')
+        if response.status_code == 304:
+            if cached:
+                self.count('not_modified')
+                return cached['body']
+            # nothing to revalidate (the cache file went away, or a proxy answered), ask again plainly
+            response = self.session.get(url, timeout=self.timeout)
+            self.count('requests')
+        response.raise_for_status()
+        body = response.json()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if self.cache and (etag or last_modified):
+            self.cache.save(url, etag, last_modified, body)
+        return body
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,4 +1,5 @@
-from flask import jsonify, url_for
+import hashlib
+from flask import jsonify, url_for, request, current_app
 
 class APIException(Exception):
     status_code = 400
@@ -15,13 +16,26 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def conditional_response(body, etag=None, last_modified=None):
+    """JSON response for already encoded bytes, answering 304 when the client's
+    If-None-Match/If-Modified-Since still matches. Cache-Control comes from
+    app.config['CACHE_CONTROL'] keyed by endpoint name."""
+    response = current_app.response_class(body, mimetype='application/json')
+    cache_control = current_app.config.get('CACHE_CONTROL', {}).get(request.endpoint)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    response.set_etag(etag or hashlib.sha1(body).hexdigest())
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response.make_conditional(request)
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
 def generate_sitemap(app):
-    links = ['/admin/']
+    links = ['/admin/'] if 'admin' in app.blueprints else []
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
@@ -1,7 +1,12 @@
 # This file was created to run the application on heroku using gunicorn.
 # Read more about it here: https://devcenter.heroku.com/articles/python-gunicorn
 
-from main import app as application
+from main import create_app
+from api import preload_catalog
+
+application = create_app()
+# gunicorn imports this file in every worker, the catalog is encoded before the first request
+preload_catalog(application)
 
 if __name__ == "__main__":
     application.run()
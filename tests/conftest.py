@@ -0,0 +1,84 @@
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from main import create_app  # noqa: E402
+from models import db, Character, Planet  # noqa: E402
+
+PASSWORD = 'Abcdef1!'
+
+
+@pytest.fixture
+def app_config():
+    """Settings a test module adds to the app's, override it in the module."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    app = create_app(dict({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'TESTING': True,
+        # cheap hashes inline, no rate limits, and none of the admin or migration setup
+        'PASSWORD_HASH_WORKERS': 0,
+        'PASSWORD_HASH_ITERATIONS': 1000,
+        'RATE_LIMIT_ENABLED': False,
+        'ADMIN_ENABLED': False,
+        'MIGRATE_ENABLED': False,
+    }, **app_config))
+    with app.app_context():
+        db.create_all()
+        # inserted like `flask import-swapi` does, without the on_commit hooks
+        db.session.execute(Character.__table__.insert(), [{
+            'name': 'Character %d' % i, 'birth_day': '19BBY', 'gender': 'n/a', 'height': 100,
+            'skin_color': 'gold', 'hair_color': 'none', 'eye_color': 'yellow'} for i in range(20)])
+        db.session.execute(Planet.__table__.insert(), [{
+            'name': 'Planet %d' % i, 'climate': 'arid', 'population': '1000', 'terrain': 'desert',
+            'rotation_period': 23, 'orbital_period': 304, 'diameter': 10465} for i in range(20)])
+        db.session.commit()
+    yield app
+    app.extensions['search_index'].close()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def count_statements(app):
+    """count_statements() is a context manager yielding the list of SQL statements the
+    engine ran inside the block."""
+    @contextmanager
+    def count_statements():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return count_statements
+
+
+def signup(client, username, password=PASSWORD):
+    return client.post('/signup', json={'username': username, 'email': username + '@example.com', 'password': password})
+
+def auth_headers(client, username, password=PASSWORD):
+    """Signs the user up and returns the Authorization header of a fresh token."""
+    signup(client, username, password)
+    response = client.post('/login', json={'username': username, 'password': password})
+    return {'Authorization': 'Bearer ' + response.get_json()[1]['token']}
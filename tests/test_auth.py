@@ -0,0 +1,28 @@
+import pytest
+from flask_jwt_extended import create_access_token
+
+from conftest import signup
+from identity import CurrentUser
+from models import db, User
+
+
+def deactivated_user_token(app, client):
+    """A token claiming is_active for a user deactivated since."""
+    signup(client, 'gone')
+    with app.app_context():
+        user = User.query.filter_by(username='gone').one()
+        user.is_active = False
+        db.session.commit()
+        with app.test_request_context():
+            token = create_access_token(identity=CurrentUser(user.id, True), additional_claims={'is_active': True})
+    return {'Authorization': 'Bearer ' + token}
+
+
+def test_is_active_claim_ignored_unless_embedded(app, client):
+    assert client.get('/favorites', headers=deactivated_user_token(app, client)).status_code == 401
+
+
+@pytest.mark.parametrize('app_config', [{'JWT_EMBED_USER_CLAIMS': True}])
+def test_is_active_claim_trusted_when_embedded(app, client):
+    # the documented trade-off: the user keeps access until the token expires
+    assert client.get('/favorites', headers=deactivated_user_token(app, client)).status_code == 200
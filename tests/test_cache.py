@@ -0,0 +1,90 @@
+import sys
+import types
+
+import pytest
+
+from cache import LRUCache, RedisCache, VersionedCache
+from main import create_app
+from models import db, Character, CacheVersion
+
+
+class FakeRedis:
+    """The part of redis.Redis that RedisCache uses, on a dict."""
+
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.expires[key] = ex
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+def test_redis_cache():
+    client = FakeRedis()
+    cache = RedisCache(client, ttl=60, prefix='test:')
+    assert cache.get('a') is None
+    cache.set('a', b'1')
+    cache.set('b', b'2')
+    assert cache.get('a') == b'1'
+    assert client.expires == {'test:a': 60, 'test:b': 60}
+    cache.delete('a')
+    assert cache.get('a') is None
+    cache.clear()
+    assert client.values == {}
+    assert cache.stats() == {'backend': 'redis', 'hits': 1, 'misses': 2, 'evictions': 0}
+
+
+def test_versioned_cache_clears_when_the_version_moves():
+    version = [0]
+    cache = VersionedCache(LRUCache(), lambda: version[0], lambda: None, check_seconds=0)
+    cache.set('a', b'1')
+    assert cache.get('a') == b'1'
+    version[0] += 1
+    assert cache.get('a') is None
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setitem(sys.modules, 'redis', types.SimpleNamespace(
+        Redis=types.SimpleNamespace(from_url=lambda url: client)))
+    return client
+
+
+@pytest.mark.parametrize('app_config', [{'CACHE_REDIS_URL': 'redis://fake'}])
+def test_commits_delete_the_redis_entries(fake_redis, app, client):
+    assert isinstance(app.extensions['catalog_cache'], RedisCache)
+    assert client.get('/character/1').get_json()[0]['name'] == 'Character 0'
+    assert 'flask-rest:character:1' in fake_redis.values
+    with app.app_context():
+        db.session.get(Character, 1).name = 'Renamed'
+        db.session.commit()
+    assert 'flask-rest:character:1' not in fake_redis.values
+    assert client.get('/character/1').get_json()[0]['name'] == 'Renamed'
+
+
+@pytest.mark.parametrize('app_config', [{'CACHE_CHECK_SECONDS': 0}])
+def test_edits_in_another_worker_reach_the_memory_cache(app, client):
+    other_worker = create_app(dict(app.config))
+    assert client.get('/character/1').get_json()[0]['name'] == 'Character 0'
+    with other_worker.app_context():
+        version = CacheVersion.current(db.engine, 'catalog')
+        db.session.get(Character, 1).name = 'Renamed'
+        db.session.commit()
+        assert CacheVersion.current(db.engine, 'catalog') == version + 1
+    assert client.get('/character/1').get_json()[0]['name'] == 'Renamed'
+
+
+def test_cache_version_bumps(app):
+    with app.app_context():
+        assert CacheVersion.current(db.engine, 'missing') == 0
+        CacheVersion.bump(db.engine, 'missing')
+        CacheVersion.bump(db.engine, 'missing')
+        assert CacheVersion.current(db.engine, 'missing') == 2
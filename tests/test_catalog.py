@@ -0,0 +1,38 @@
+import pytest
+
+from api import preload_catalog
+from main import create_app
+from models import db, Character
+
+
+def test_catalog_responses_are_conditional_on_the_etag(client):
+    response = client.get('/character/1')
+    assert response.status_code == 200
+    assert response.get_json() == [{'id': 1, 'name': 'Character 0', 'birth_day': '19BBY', 'gender': 'n/a', 'height': 100,
+                                    'skin_color': 'gold', 'hair_color': 'none', 'eye_color': 'yellow'}]
+    assert 'Last-Modified' not in response.headers
+    etag = response.headers['ETag']
+    assert client.get('/character/1', headers={'If-None-Match': etag}).status_code == 304
+
+
+@pytest.mark.parametrize('path', ['/character/1', '/planet/2'])
+def test_workers_send_the_same_validators(app, client, path):
+    other_worker = create_app(dict(app.config)).test_client()
+    first, second = client.get(path), other_worker.get(path)
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert first.get_data() == second.get_data()
+
+
+@pytest.mark.parametrize('app_config', [{'CATALOG_PRELOAD': True, 'CACHE_TTL': 0, 'CACHE_MAX_ENTRIES': 1}])
+def test_preloaded_catalog_outlives_the_ttl_and_size(app, client, count_statements):
+    preload_catalog(app)
+    with count_statements() as statements:
+        for id in range(1, 21):
+            assert client.get('/character/%d' % id).status_code == 200
+            assert client.get('/planet/%d' % id).status_code == 200
+    assert statements == []
+
+    with app.app_context():
+        db.session.get(Character, 3).name = 'Renamed'
+        db.session.commit()
+    assert client.get('/character/3').get_json()[0]['name'] == 'Renamed'
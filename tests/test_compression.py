@@ -0,0 +1,39 @@
+import gzip
+import json
+
+from compression import GzipCompressor, compress_stream, stream_json_array
+from conftest import auth_headers
+from encoding import encode_json
+from models import db, FavoriteSummary
+
+ITEMS = [{"character_id": i, "characters": "Character %d" % i} for i in range(600)]
+
+
+def test_stream_json_array_is_the_whole_array_in_a_few_chunks():
+    chunks = list(stream_json_array(iter(ITEMS[3:]), encode_json, first_items=ITEMS[:3]))
+    assert json.loads(b''.join(chunks)) == ITEMS
+    assert len(chunks) < 5
+
+def test_stream_json_array_of_nothing():
+    assert b''.join(stream_json_array(iter([]), encode_json)) == b'[]'
+
+
+def test_compressed_stream_is_about_as_small_as_the_whole_body():
+    body = b''.join(stream_json_array(iter(ITEMS), encode_json))
+    # one chunk per item, the worst case for the stream
+    chunks = [encode_json(item) for item in ITEMS]
+    streamed = b''.join(compress_stream(chunks, GzipCompressor(6)))
+    assert gzip.decompress(streamed) == b''.join(chunks)
+    assert len(streamed) < len(gzip.compress(body, 6)) * 1.2
+
+
+def test_favorites_stream_is_compressed(app, client):
+    app.config['STREAM_THRESHOLD'] = 5
+    headers = auth_headers(client, 'many')
+    client.post('/favorites/bulk', headers=headers, json={'character_ids': list(range(1, 21))})
+    with app.app_context():
+        FavoriteSummary.query.delete()
+        db.session.commit()
+    response = client.get('/favorites', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(json.loads(gzip.decompress(response.get_data()))) == 20
@@ -0,0 +1,19 @@
+import pytest
+
+import encoding
+
+BODIES = [
+    {"name": "Jabba Desilijic Tiure", "height": 175, "mass": 1358.5, "hair_color": None},
+    [{"characters": "Padmé Amidala", "character_id": 35}, {"planets": "Zolan ☼", "planet_id": 58}],
+    {"escaped": "quote \" backslash \\ newline \n tab \t", "empty": [], "nested": {"b": 1, "a": [True, False]}},
+]
+
+
+@pytest.mark.parametrize('body', BODIES)
+def test_encoders_write_the_same_bytes(body):
+    pytest.importorskip('orjson')
+    assert encoding.encode_json(body) == encoding.encode_orjson(body)
+
+
+def test_json_encoder_writes_utf8():
+    assert encoding.encode_json({"name": "Padmé"}) == '{"name":"Padmé"}'.encode('utf-8')
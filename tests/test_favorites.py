@@ -0,0 +1,92 @@
+from conftest import auth_headers
+from models import db, FavoriteSummary
+
+
+def add_favorites(client, headers, count):
+    response = client.post('/favorites/bulk', headers=headers, json={'character_ids': list(range(1, count + 1))})
+    assert response.status_code == 200
+
+
+def favorites_statements(client, count_statements, headers):
+    with count_statements() as statements:
+        response = client.get('/favorites', headers=headers)
+    assert response.status_code == 200
+    return statements
+
+
+def test_get_favorites_statements_dont_grow_with_favorites(app, client, count_statements):
+    one = auth_headers(client, 'one')
+    many = auth_headers(client, 'many')
+    add_favorites(client, one, 1)
+    add_favorites(client, many, 15)
+    assert len(client.get('/favorites', headers=many).get_json()) == 15
+
+    # summaries kept up to date by the writes
+    assert len(favorites_statements(client, count_statements, one)) == len(favorites_statements(client, count_statements, many))
+
+    # summaries missing, the list is built from the favorites
+    with app.app_context():
+        FavoriteSummary.query.delete()
+        db.session.commit()
+    assert len(favorites_statements(client, count_statements, one)) == len(favorites_statements(client, count_statements, many))
+
+
+def test_get_favorites_reads_one_row(client, count_statements):
+    one = auth_headers(client, 'one')
+    many = auth_headers(client, 'many')
+    add_favorites(client, one, 1)
+    add_favorites(client, many, 20)
+    # the first reads fill the identity cache
+    client.get('/favorites', headers=one)
+    client.get('/favorites', headers=many)
+
+    for headers in (one, many):
+        statements = favorites_statements(client, count_statements, headers)
+        assert len(statements) == 1
+        assert 'favorite_summary' in statements[0] and 'JOIN' not in statements[0]
+
+
+def test_long_favorites_list_without_summary_is_streamed(app, client):
+    app.config['STREAM_THRESHOLD'] = 5
+    headers = auth_headers(client, 'many')
+    add_favorites(client, headers, 12)
+    expected = client.get('/favorites', headers=headers).get_json()
+    with app.app_context():
+        FavoriteSummary.query.delete()
+        db.session.commit()
+
+    response = client.get('/favorites', headers=headers)
+    assert response.get_json() == expected
+    assert response.headers['Cache-Control'] == app.config['CACHE_CONTROL']['api.get_favorites']
+    assert 'ETag' not in response.headers
+    with app.app_context():
+        assert FavoriteSummary.stored(1) is None
+
+    # the next change stores it again
+    client.post('/favorites', headers=headers, json={'planet_id': 1})
+    response = client.get('/favorites', headers=headers)
+    assert response.get_json() == expected + [{'planet_id': 1, 'planets': 'Planet 0'}]
+    assert 'ETag' in response.headers
+
+
+def test_favorite_of_a_missing_character_can_be_removed(client):
+    headers = auth_headers(client, 'dangling')
+    add_favorites(client, headers, 2)
+    client.post('/favorites', headers=headers, json={'character_id': 999})
+    client.post('/favorites', headers=headers, json={'character_id': 999})
+    # served as null, like the favorite table gives it
+    assert client.get('/favorites', headers=headers).get_json() == [
+        {'character_id': 1, 'characters': 'Character 0'}, {'character_id': 2, 'characters': 'Character 1'}, None]
+
+    response = client.delete('/favorites/bulk', headers=headers, json={'character_ids': [999, 1]})
+    assert response.get_json() == {'removed': 2}
+    assert client.get('/favorites', headers=headers).get_json() == [{'character_id': 2, 'characters': 'Character 1'}]
+
+
+def test_bulk_favorites_body_must_be_an_object(client):
+    headers = auth_headers(client, 'bulk')
+    for body in ([1, 2], 'x', None):
+        for method in (client.post, client.delete):
+            response = method('/favorites/bulk', headers=headers, json=body)
+            assert response.status_code == 400
+            assert response.get_json() == [{'msg': 'The body must be a JSON object'}]
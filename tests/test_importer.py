@@ -0,0 +1,27 @@
+import json
+
+from importer import import_swapi_command
+from models import db, Planet
+
+
+def test_import_if_empty_skips_seeded_tables(app):
+    # the app fixture seeds both tables, nothing may reach swapi.dev
+    result = app.test_cli_runner().invoke(import_swapi_command, ['--if-empty'])
+    assert result.exit_code == 0, result.output
+    assert result.output == 'people: already imported, skipped\nplanets: already imported, skipped\n'
+
+
+def test_import_if_empty_fills_empty_tables(app, tmp_path):
+    with app.app_context():
+        Planet.query.delete()
+        db.session.commit()
+    (tmp_path / 'planets').mkdir()
+    (tmp_path / 'planets' / '1.json').write_text(json.dumps({'count': 1, 'results': [{
+        'name': 'Tatooine', 'climate': 'arid', 'population': '200000', 'terrain': 'desert',
+        'rotation_period': '23', 'orbital_period': '304', 'diameter': '10465'}]}))
+
+    result = app.test_cli_runner().invoke(import_swapi_command, ['--if-empty', '--fixtures', str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    assert result.output == 'people: already imported, skipped\nplanets: 1 new rows\n'
+    with app.app_context():
+        assert [planet.name for planet in Planet.query] == ['Tatooine']
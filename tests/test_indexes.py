@@ -0,0 +1,17 @@
+from sqlalchemy import select, text
+
+from models import db, Favorite
+
+
+def query_plan(statement):
+    sql = str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    return ' '.join(row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+
+
+def test_favorites_of_a_user_use_an_index(app):
+    with app.app_context():
+        for statement in (select(Favorite.id).where(Favorite.user_id == 1), Favorite.rows_for_user_statement(1)):
+            plan = query_plan(statement)
+            # a SEARCH on one of the unique indexes, never a SCAN of the whole table
+            assert 'ix_favorite_user_' in plan, plan
+            assert 'SCAN favorite' not in plan and 'SCAN TABLE favorite' not in plan, plan
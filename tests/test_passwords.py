@@ -0,0 +1,20 @@
+import passwords
+
+
+def test_default_workers_split_the_cores_between_gunicorn_processes(monkeypatch):
+    monkeypatch.setattr(passwords.os, 'cpu_count', lambda: 8)
+    monkeypatch.setenv('WEB_CONCURRENCY', '2')
+    assert passwords.default_workers() == 4
+    monkeypatch.setenv('WEB_CONCURRENCY', '16')
+    assert passwords.default_workers() == 1
+    monkeypatch.delenv('WEB_CONCURRENCY')
+    assert passwords.default_workers() == 8
+
+
+def test_hashes_in_the_pool(app):
+    app.config['PASSWORD_HASH_WORKERS'] = 1
+    with app.app_context():
+        stored = passwords.hash_password('Abcdef1!')
+        assert passwords.verify_password('Abcdef1!', stored)
+        assert not passwords.verify_password('Abcdef1?', stored)
+        assert not passwords.needs_rehash(stored)
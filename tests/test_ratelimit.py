@@ -0,0 +1,82 @@
+import pytest
+
+import ratelimit
+from conftest import PASSWORD, signup
+from ratelimit import MemoryBucketStore, parse_rate
+
+
+class FakeBucketStore:
+    """Counts the takes per key, a bucket is empty after `capacity` of them."""
+
+    def __init__(self):
+        self.taken = {}
+
+    def take(self, key, capacity, period):
+        self.taken[key] = self.taken.get(key, 0) + 1
+        return 0 if self.taken[key] <= capacity else 30.5
+
+
+@pytest.fixture
+def app_config():
+    return {'RATE_LIMIT_ENABLED': True, 'RATE_LIMIT_PER_IP': '10/60', 'RATE_LIMIT_PER_USERNAME': '3/60'}
+
+
+@pytest.fixture
+def store(app, client):
+    signup(client, 'luke')
+    store = app.extensions['rate_limit_store'] = FakeBucketStore()
+    return store
+
+
+def login(client, username='luke'):
+    return client.post('/login', json={'username': username, 'password': PASSWORD})
+
+
+def test_login_over_the_limit_is_rejected_before_the_view(client, store, count_statements):
+    for _ in range(3):
+        assert login(client).status_code == 200
+    with count_statements() as statements:
+        response = login(client)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '31'
+    assert response.get_json() == {'msg': 'Too many requests, try again later'}
+    assert statements == []
+
+
+def test_rejected_by_the_ip_bucket_leaves_the_username_bucket_alone(app, client, store):
+    app.config['RATE_LIMIT_PER_IP'] = '1/60'
+    assert login(client).status_code == 200
+    assert login(client).status_code == 429
+    assert store.taken == {'login:ip:127.0.0.1': 2, 'login:username:luke': 1}
+
+
+def test_username_bucket_ignores_case(client, store):
+    for username in ('luke', 'Luke', 'LUKE'):
+        login(client, username)
+    assert store.taken['login:username:luke'] == 3
+
+
+def test_client_ip_comes_from_the_trusted_proxy(app, client, store):
+    client.post('/login', json={'username': 'luke', 'password': PASSWORD},
+                headers={'X-Forwarded-For': '203.0.113.7'})
+    # TRUSTED_PROXY_HOPS is 0, the header isn't trusted
+    assert 'login:ip:127.0.0.1' in store.taken
+
+
+@pytest.mark.parametrize('app_config', [{'RATE_LIMIT_ENABLED': True, 'TRUSTED_PROXY_HOPS': 1}])
+def test_client_ip_behind_one_proxy(app, client, store):
+    client.post('/login', json={'username': 'luke', 'password': PASSWORD},
+                headers={'X-Forwarded-For': '203.0.113.7'})
+    assert 'login:ip:203.0.113.7' in store.taken
+
+
+def test_memory_bucket_store_refills(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    store = MemoryBucketStore()
+    capacity, period = parse_rate('2/60')
+    assert [store.take('a', capacity, period) for _ in range(3)] == [0, 0, 30]
+    assert store.take('b', capacity, period) == 0
+    now[0] += 30
+    assert store.take('a', capacity, period) == 0
+    assert store.take('a', capacity, period) == 30
@@ -0,0 +1,60 @@
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from conftest import auth_headers
+from identity import CurrentUser
+from main import create_app
+from models import db
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    return {'SQLALCHEMY_BINDS': {'replica': 'sqlite:///' + str(tmp_path / 'replica.db')}}
+
+
+def record_replica_statements(app):
+    statements = []
+    with app.app_context():
+        replica = db.get_engine(app, bind='replica')
+    event.listen(replica, 'before_cursor_execute', lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+@pytest.fixture
+def replica_statements(app):
+    """The statements run on the replica, whose tables stay empty like a replica lagging behind."""
+    with app.app_context():
+        db.metadata.create_all(db.get_engine(app, bind='replica'))
+    return record_replica_statements(app)
+
+
+def test_new_token_reads_from_the_primary(app, client, replica_statements):
+    headers = auth_headers(client, 'new')
+    assert client.get('/favorites', headers=headers).status_code == 200
+    assert replica_statements == []
+
+
+def test_stickiness_follows_the_user_not_the_token(app, replica_statements):
+    # an API client that doesn't keep the sticky cookie
+    client = app.test_client(use_cookies=False)
+    headers = auth_headers(client, 'writer')
+    client.post('/favorites', headers=headers, json={'character_id': 1})
+    with app.test_request_context():
+        other_token = create_access_token(identity=CurrentUser(1, True))
+    response = client.get('/favorites', headers={'Authorization': 'Bearer ' + other_token})
+    assert response.get_json() == [{'character_id': 1, 'characters': 'Character 0'}]
+    assert replica_statements == []
+
+
+def test_user_missing_on_the_replica_is_looked_up_on_the_primary(app, client, replica_statements):
+    headers = auth_headers(client, 'new')
+    client.post('/favorites', headers=headers, json={'character_id': 1})
+    # another worker, which didn't see the writes and gets no sticky cookie
+    other_app = create_app(dict(app.config))
+    replica_statements = record_replica_statements(other_app)
+    response = other_app.test_client(use_cookies=False).get('/favorites', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json() == [{'character_id': 1, 'characters': 'Character 0'}]
+    # the user lookup missed on the replica, then everything ran on the primary
+    assert len(replica_statements) == 1 and 'FROM user' in replica_statements[0]
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from models import db, Character
+
+
+@pytest.fixture
+def app_config():
+    return {'SEARCH_CHECK_SECONDS': 0.05}
+
+
+def search(client, query):
+    response = client.get('/search', query_string={'q': query})
+    assert response.status_code == 200
+    return [result['name'] for result in response.get_json()]
+
+
+def test_search_runs_no_queries_once_built(client, count_statements):
+    assert search(client, 'planet 1') == ['Planet 1', 'Planet 10', 'Planet 11', 'Planet 12', 'Planet 13',
+                                          'Planet 14', 'Planet 15', 'Planet 16', 'Planet 17', 'Planet 18', 'Planet 19']
+    with count_statements() as statements:
+        search(client, 'charac')
+        search(client, 'planet 2')
+    assert statements == []
+
+
+def test_commits_update_the_index(app, client):
+    search(client, 'x')
+    with app.app_context():
+        db.session.add(Character(name='Yoda', birth_day='896BBY', gender='male', height=66,
+                                 skin_color='green', hair_color='white', eye_color='brown'))
+        db.session.commit()
+    assert search(client, 'yo') == ['Yoda']
+
+
+def test_rows_inserted_elsewhere_are_picked_up_in_the_background(app, client):
+    search(client, 'x')
+    with app.app_context():
+        # bulk inserts skip on_commit, like `flask import-swapi` or another worker
+        db.session.execute(Character.__table__.insert(), [{
+            'name': 'Wicket', 'birth_day': '8BBY', 'gender': 'male', 'height': 88,
+            'skin_color': 'brown', 'hair_color': 'brown', 'eye_color': 'brown'}])
+        db.session.commit()
+    deadline = time.monotonic() + 5
+    while search(client, 'wick') != ['Wicket']:
+        assert time.monotonic() < deadline, 'the index was never refreshed'
+        time.sleep(0.05)
@@ -0,0 +1,42 @@
+import threading
+
+from conftest import PASSWORD, signup
+from models import User
+
+SIGNUPS = 8
+
+
+def test_parallel_signups_create_one_user(app):
+    barrier = threading.Barrier(SIGNUPS)
+    statuses = []
+
+    def race():
+        client = app.test_client()
+        barrier.wait()
+        statuses.append(signup(client, 'racer').status_code)
+
+    threads = [threading.Thread(target=race) for _ in range(SIGNUPS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200] + [400] * (SIGNUPS - 1)
+    with app.app_context():
+        assert User.query.filter_by(username='racer').count() == 1
+
+
+def test_signup_runs_one_statement(client, count_statements):
+    with count_statements() as statements:
+        response = client.post('/signup', json={'username': 'solo', 'email': 'solo@example.com', 'password': PASSWORD})
+    assert response.status_code == 200
+    # the INSERT, nothing checks for an existing username or email beforehand
+    assert len(statements) == 1
+    assert statements[0].startswith('INSERT INTO user')
+
+
+def test_signup_reports_the_taken_fields(client):
+    signup(client, 'taken')
+    response = client.post('/signup', json={'username': 'taken', 'email': 'other@example.com', 'password': PASSWORD})
+    assert response.status_code == 400
+    assert response.get_json() == [{'msg': 'This username already exists. Check your username'}]
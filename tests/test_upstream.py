@@ -0,0 +1,93 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+
+from upstream import UpstreamClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers with the server's queued (status, headers) first, then 200 with an ETag
+    and 304 when If-None-Match matches it."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get('If-None-Match')))
+        if server.queued:
+            status, headers = server.queued.pop(0)
+        elif self.headers.get('If-None-Match') == '"v1"':
+            status, headers = 304, {'ETag': '"v1"'}
+        else:
+            status, headers = 200, {'ETag': '"v1"'}
+        body = json.dumps({"path": self.path}).encode() if status == 200 else b''
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = HTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = []
+    server.queued = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def client_for(stub, **options):
+    return UpstreamClient('http://127.0.0.1:%d/api/' % stub.server_port, backoff=0, **options)
+
+
+def test_retries_server_errors(stub):
+    stub.queued = [(503, {}), (503, {'Retry-After': '0'})]
+    with client_for(stub) as client:
+        assert client.get_json('people/', params={'page': 1}) == {"path": "/api/people/?page=1"}
+    assert len(stub.requests) == 3
+
+
+def test_gives_up_after_the_retries(stub):
+    stub.queued = [(503, {})] * 3
+    with client_for(stub, retries=2) as client:
+        with pytest.raises(requests.HTTPError):
+            client.get_json('people/')
+    assert len(stub.requests) == 3
+
+
+def test_second_run_is_served_from_the_cache(stub, tmp_path):
+    for run in range(2):
+        with client_for(stub, cache_dir=str(tmp_path)) as client:
+            for page in (1, 2, 3):
+                assert client.get_json('planets/', params={'page': page}) == {"path": "/api/planets/?page=%d" % page}
+            stats = client.stats
+    # every page of the second run was revalidated, and came back 304
+    assert stats == {"requests": 3, "not_modified": 3}
+    assert [etag for _, etag in stub.requests] == [None] * 3 + ['"v1"'] * 3
+
+
+def test_304_without_a_cache_entry_asks_again(stub, tmp_path):
+    stub.queued = [(304, {})]
+    with client_for(stub, cache_dir=str(tmp_path)) as client:
+        assert client.get_json('people/') == {"path": "/api/people/"}
+        assert client.stats == {"requests": 2, "not_modified": 0}
+
+
+def test_read_timeout(stub):
+    class SlowHandler(StubHandler):
+        def do_GET(self):
+            threading.Event().wait(1)
+
+    stub.RequestHandlerClass = SlowHandler
+    with client_for(stub, timeout=(1, 0.2), retries=0) as client:
+        with pytest.raises((requests.Timeout, requests.ConnectionError)):
+            client.get_json('people/')